@@ -0,0 +1,104 @@
+import hashlib
+import logging
+import os
+import uuid
+import numpy as np
+from pathlib import Path
+from .core import config
+
+logger = logging.getLogger(__name__)
+
+# Read size used when hashing files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """SHA-256 of a file's contents, read in chunks"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as file_object:
+        while chunk := file_object.read(HASH_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class ArtifactCache:
+    """Size-bounded LRU cache of pipeline intermediates keyed by content hash and parameters
+
+    Each artifact is a .npz file of named arrays. Reads refresh the file's
+    modification time, and writes evict the least recently used files until
+    the cache fits within max_bytes. Durable artifacts live in durable_root
+    instead and are never evicted.
+    """
+
+    def __init__(self, root=None, max_bytes=None, durable_root=None):
+        self.root = Path(root or config.CACHE_DIR)
+        self.durable_root = Path(durable_root or config.ARTIFACT_DIR)
+        self.max_bytes = config.CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.durable_root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(content_hash, stage, **params):
+        """Artifact name for a stage of a given input and parameter set"""
+        parts = [content_hash, stage] + [f"{name}-{params[name]}" for name in sorted(params)]
+        return "_".join(str(part) for part in parts) + ".npz"
+
+    def path(self, key, durable=False):
+        return (self.durable_root if durable else self.root) / key
+
+    def get(self, key, durable=False):
+        """Load an artifact as a dict of arrays, or None on a miss"""
+        path = self.path(key, durable)
+        if durable and not path.exists():
+            # Durable artifacts cached before they were kept apart move out of reach of eviction
+            try:
+                os.replace(self.path(key), path)
+            except FileNotFoundError:
+                return None
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache artifact {key}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        logger.debug(f"Cache hit {key}")
+        return arrays
+
+    def put(self, key, compress=False, durable=False, **arrays):
+        """Store an artifact atomically, then evict old entries"""
+        path = self.path(key, durable)
+        tmp_path = path.parent / f".{uuid.uuid4()}.tmp.npz"
+        save = np.savez_compressed if compress else np.savez
+        save(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        self.evict()
+        return path
+
+    def evict(self):
+        """Delete least recently used artifacts until the cache fits its size bound"""
+        entries = []
+        for path in self.root.glob("*.npz"):
+            if path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            logger.debug(f"Evicted cache artifact {path.name}")
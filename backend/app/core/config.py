@@ -0,0 +1,85 @@
+import os
+
+# Color quantization engine used when a job does not request one
+QUANTIZER = os.getenv("QUANTIZER", "kmeans")
+
+# Seed shared by every quantization engine so results are reproducible
+QUANTIZER_SEED = int(os.getenv("QUANTIZER_SEED", "42"))
+
+# Directory and size bound of the intermediate-artifact cache
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# Directory of durable artifacts (palette hierarchies), never evicted so
+# re-renders of any upload stay cheap
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "uploads/palettes")
+
+# Redis connection used by the job queue
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+
+# Worker processes started by the supervisor (defaults to the core count)
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0")) or os.cpu_count() or 1
+
+# Threads one job may use, shared by OpenCV, BLAS/OpenMP (KMeans) and the
+# job's own parallel steps. Defaults to an even share of the cores per worker.
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "0")) or max(1, (os.cpu_count() or 1) // WORKER_PROCESSES)
+
+# Seconds a claimed job may go without a heartbeat before it is requeued
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+# Seconds a worker blocks waiting for a job before re-checking for shutdown
+DEQUEUE_TIMEOUT = int(os.getenv("DEQUEUE_TIMEOUT", "5"))
+
+# Seconds between sweeps for expired leases
+REAPER_INTERVAL = int(os.getenv("REAPER_INTERVAL", "15"))
+
+# Times a job may lose its lease before it is marked failed
+MAX_JOB_ATTEMPTS = int(os.getenv("MAX_JOB_ATTEMPTS", "3"))
+
+# Relative share of dequeues given to each priority lane when all are busy
+LANE_WEIGHTS = {
+    lane: int(weight)
+    for lane, weight in (item.split("=") for item in os.getenv("LANE_WEIGHTS", "preview=12,interactive=6,rerender=3,batch=1").split(","))
+}
+
+# Jobs a worker claims per round trip (small jobs amortize the Redis call)
+WORKER_BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", "1"))
+
+# Largest accepted upload in bytes
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 ** 2)))
+
+# Limits of one batch upload: total request bytes, images (archive members
+# included) and ids per bulk status query
+MAX_BATCH_BYTES = int(os.getenv("MAX_BATCH_BYTES", str(2 * 1024 ** 3)))
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "500"))
+MAX_STATUS_IDS = int(os.getenv("MAX_STATUS_IDS", "500"))
+# Uploads one event stream follows; the ids travel in its URL
+MAX_EVENT_STREAM_IDS = int(os.getenv("MAX_EVENT_STREAM_IDS", "100"))
+
+# Largest accepted image in pixels (width * height), checked from the header
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(100_000_000)))
+
+# Per-job memory budget in MB. When set, large buffers are processed in
+# overlapping bands sized to fit. 0 processes whole images at once.
+MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", "0"))
+
+# Worker processes whose peak RSS passes this many MB exit after their current
+# job and are replaced by the supervisor. 0 never recycles workers.
+WORKER_MAX_RSS_MB = int(os.getenv("WORKER_MAX_RSS_MB", "0"))
+
+# Fast preview tier. New uploads first get a low-resolution conversion on the
+# preview lane, processed FAST_PREVIEW_WIDTH wide with a quick quantizer and
+# drawn at twice that width, ahead of the full render. 0 disables it.
+FAST_PREVIEW_WIDTH = int(os.getenv("FAST_PREVIEW_WIDTH", "512"))
+FAST_PREVIEW_QUANTIZER = os.getenv("FAST_PREVIEW_QUANTIZER", "histogram")
+
+# Output encoding. OUTPUT_FORMAT is png (palette-indexed), webp or jpeg
+# (progressive); a WebP quality above 100 is lossless. Previews and thumbnails
+# are downscaled copies written with PREVIEW_FORMAT.
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "png")
+OUTPUT_QUALITY = int(os.getenv("OUTPUT_QUALITY", "90"))
+PNG_COMPRESSION = int(os.getenv("PNG_COMPRESSION", "6"))
+PREVIEW_FORMAT = os.getenv("PREVIEW_FORMAT", "webp")
+PREVIEW_QUALITY = int(os.getenv("PREVIEW_QUALITY", "80"))
+PREVIEW_WIDTH = int(os.getenv("PREVIEW_WIDTH", "1280"))
+THUMBNAIL_WIDTH = int(os.getenv("THUMBNAIL_WIDTH", "320"))
@@ -1,14 +1,38 @@
 import os
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from ..models.upload import Base
 
 SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///uploads.db"
 
+# Use synchronous SQLite URL for the worker
+SYNC_DATABASE_URL = "sqlite:///uploads.db"
+
+# Log every SQL statement only when explicitly asked to
+DATABASE_ECHO = os.getenv("DATABASE_ECHO", "").lower() in ("1", "true", "yes")
+
+# SQLite settings applied to every new connection. WAL lets the API read while
+# the worker writes; NORMAL sync is durable enough in WAL mode and much faster.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -20000,  # 20 MB page cache
+    "temp_store": "MEMORY",
+}
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
 engine = create_async_engine(
     SQLALCHEMY_DATABASE_URL,
-    echo=True,
+    echo=DATABASE_ECHO,
 )
+event.listen(engine.sync_engine, "connect", set_sqlite_pragmas)
 
 async_session = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
@@ -18,13 +42,25 @@ async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
-async def get_db():
-    async with async_session() as session:
-        yield session
-
 async def get_db():
     async with async_session() as session:
         try:
             yield session
         finally:
-            await session.close() 
\ No newline at end of file
+            await session.close()
+
+# One pooled synchronous engine per process, created lazily so forked workers
+# never share connections with their parent
+_sync_engine = None
+_sync_engine_pid = None
+_sync_session = None
+
+def get_sync_session():
+    """New session on this process's shared synchronous engine"""
+    global _sync_engine, _sync_engine_pid, _sync_session
+    if _sync_engine is None or _sync_engine_pid != os.getpid():
+        _sync_engine = create_engine(SYNC_DATABASE_URL, echo=DATABASE_ECHO, pool_pre_ping=True)
+        event.listen(_sync_engine, "connect", set_sqlite_pragmas)
+        _sync_engine_pid = os.getpid()
+        _sync_session = sessionmaker(bind=_sync_engine)
+    return _sync_session()
@@ -0,0 +1,72 @@
+from starlette.responses import JSONResponse
+
+
+class RequestSizeLimitExceeded(Exception):
+    pass
+
+
+class BodySizeLimitMiddleware:
+    """Reject request bodies larger than a path's limit before they are spooled to disk
+
+    limits maps path prefixes to their byte limit; the longest matching
+    prefix applies. The declared Content-Length is checked up front, and the
+    streamed body is counted so that chunked or mislabelled requests are cut
+    off as soon as they cross the limit.
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        # Longest prefixes first so the most specific limit wins
+        self.limits = sorted(limits.items(), key=lambda item: -len(item[0]))
+
+    def limit_for(self, path):
+        return next((max_bytes for prefix, max_bytes in self.limits if path.startswith(prefix)), None)
+
+    async def __call__(self, scope, receive, send):
+        max_bytes = self.limit_for(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if max_bytes is None:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and int(content_length) > max_bytes:
+            return await self.reject(scope, receive, send, max_bytes)
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    exceeded = True
+                    raise RequestSizeLimitExceeded()
+            return message
+
+        async def limited_send(message):
+            nonlocal response_started
+            # Body parsing errors caused by the cut-off are replaced by a 413
+            if exceeded:
+                if not response_started:
+                    response_started = True
+                    await self.reject(scope, receive, send, max_bytes)
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except RequestSizeLimitExceeded:
+            if not response_started:
+                response_started = True
+                await self.reject(scope, receive, send, max_bytes)
+
+    async def reject(self, scope, receive, send, max_bytes):
+        response = JSONResponse(
+            {"error": f"Request body exceeds the {max_bytes} byte limit"}, status_code=413
+        )
+        await response(scope, receive, send)
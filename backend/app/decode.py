@@ -0,0 +1,104 @@
+import logging
+from pathlib import Path
+import cv2
+import numpy as np
+import pillow_heif
+from PIL import Image, ImageOps
+
+# Register HEIF opener with Pillow
+pillow_heif.register_heif_opener()
+
+logger = logging.getLogger(__name__)
+
+HEIF_EXTENSIONS = {".heic", ".heif"}
+
+# Reduced decode factors OpenCV supports; JPEG scales in the DCT, others after decoding
+DECODE_REDUCTIONS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+# EXIF orientation tag values mapped to the OpenCV operations that undo them
+ORIENTATION_STEPS = {
+    2: [lambda image: cv2.flip(image, 1)],
+    3: [lambda image: cv2.rotate(image, cv2.ROTATE_180)],
+    4: [lambda image: cv2.flip(image, 0)],
+    5: [lambda image: cv2.transpose(image)],
+    6: [lambda image: cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)],
+    7: [lambda image: cv2.transpose(image), lambda image: cv2.rotate(image, cv2.ROTATE_180)],
+    8: [lambda image: cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)],
+}
+EXIF_ORIENTATION = 0x0112
+
+
+def decode_reduction(width, min_width):
+    """Largest reduced-decode factor whose output is still at least min_width wide"""
+    factor = 1
+    for candidate in sorted(DECODE_REDUCTIONS):
+        if width // candidate < min_width:
+            break
+        factor = candidate
+    return factor
+
+
+def apply_orientation(image, orientation):
+    """Rotate/flip a decoded array upright according to its EXIF orientation"""
+    for step in ORIENTATION_STEPS.get(orientation, []):
+        image = step(image)
+    return image
+
+
+def decode_heif(input_path):
+    """Decode a HEIF file straight to a BGR array
+
+    libheif applies the container's rotation and mirroring while decoding,
+    so the result is already upright.
+    """
+    heif_file = pillow_heif.open_heif(str(input_path), convert_hdr_to_8bit=True)
+    if heif_file.mode != "RGB":
+        return cv2.cvtColor(np.asarray(heif_file.to_pillow().convert("RGB")), cv2.COLOR_RGB2BGR)
+    return cv2.cvtColor(np.asarray(heif_file), cv2.COLOR_RGB2BGR)
+
+
+def read_header(input_path):
+    """Stored (width, height) and EXIF orientation of an image, without decoding pixels"""
+    with Image.open(input_path) as img:
+        return img.size[0], img.size[1], img.getexif().get(EXIF_ORIENTATION, 1)
+
+
+def probe_dimensions(input_path):
+    """Upright (height, width) of an image file from its header"""
+    width, height, orientation = read_header(input_path)
+    if Path(input_path).suffix.lower() not in HEIF_EXTENSIONS and orientation in (5, 6, 7, 8):
+        width, height = height, width
+    return height, width
+
+
+def decode_image(input_path, min_width=None):
+    """Decode an input file into an upright BGR array no smaller than needed
+
+    Returns the array and the original upright (height, width). JPEG and
+    PNG inputs are decoded at the largest 1/2, 1/4 or 1/8 reduction that
+    still covers min_width (full size without one). EXIF orientation is
+    applied here rather than by the decoder so the reduction is chosen on
+    the upright width.
+    """
+    input_path = Path(input_path)
+    if input_path.suffix.lower() in HEIF_EXTENSIONS:
+        image = decode_heif(input_path)
+        return image, image.shape[:2]
+
+    # Header only: dimensions and orientation without decoding pixels
+    width, height, orientation = read_header(input_path)
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+
+    factor = decode_reduction(width, min_width) if min_width else 1
+    flags = DECODE_REDUCTIONS.get(factor, cv2.IMREAD_COLOR) | cv2.IMREAD_IGNORE_ORIENTATION
+    image = cv2.imread(str(input_path), flags)
+    if image is None:
+        # Formats OpenCV cannot read (e.g. GIF) go through Pillow at full size
+        with Image.open(input_path) as img:
+            image = cv2.cvtColor(np.asarray(ImageOps.exif_transpose(img).convert("RGB")), cv2.COLOR_RGB2BGR)
+        return image, image.shape[:2]
+
+    if factor > 1:
+        logger.debug(f"Decoded {width}x{height} input at 1/{factor} scale")
+    return apply_orientation(image, orientation), (height, width)
@@ -0,0 +1,140 @@
+import io
+import os
+from pathlib import Path
+import cv2
+import numpy as np
+from PIL import Image
+from .core import config
+
+# File extension written for each output format
+EXTENSIONS = {"png": ".png", "webp": ".webp", "jpeg": ".jpg"}
+
+
+def pack_colors(colors):
+    """Pack BGR triples into single integers for fast comparison"""
+    colors = colors.astype(np.uint32)
+    return (colors[..., 0] << 16) | (colors[..., 1] << 8) | colors[..., 2]
+
+
+def unpack_colors(codes):
+    """Unpack integers from pack_colors back into BGR triples"""
+    return np.stack([codes >> 16, (codes >> 8) & 255, codes & 255], axis=-1).astype(np.uint8)
+
+
+def palette_indices(image, palette):
+    """Map every pixel of a BGR image to an entry of a palette of at most 256 colors
+
+    The expected palette colors are matched first. Other colors (such as
+    anti-aliased text edges) are appended while the palette has room;
+    beyond 256 colors they are snapped to the nearest expected color.
+    Returns the index map and the BGR palette.
+    """
+    codes = pack_colors(image)
+    palette_codes = np.unique(pack_colors(np.asarray(palette)))
+    positions = np.minimum(np.searchsorted(palette_codes, codes), len(palette_codes) - 1)
+    unmatched = palette_codes[positions] != codes
+    if not unmatched.any():
+        return positions.astype(np.uint8), unpack_colors(palette_codes)
+
+    extra_codes, inverse = np.unique(codes[unmatched], return_inverse=True)
+    if len(palette_codes) + len(extra_codes) <= 256:
+        palette_codes = np.union1d(palette_codes, extra_codes)
+        return np.searchsorted(palette_codes, codes).astype(np.uint8), unpack_colors(palette_codes)
+
+    expected = unpack_colors(palette_codes).astype(np.int32)
+    extra = unpack_colors(extra_codes).astype(np.int32)
+    nearest = np.argmin(((extra[:, None, :] - expected[None, :, :]) ** 2).sum(axis=2), axis=1)
+    positions[unmatched] = nearest[inverse]
+    return positions.astype(np.uint8), unpack_colors(palette_codes)
+
+
+def encode_png(image, palette=None, indices=None):
+    """Encode a BGR image as PNG, palette-indexed when a palette is given
+
+    indices, when the renderer already has them, are the image as indices
+    into palette and spare matching every pixel against it.
+    """
+    if palette is None:
+        ok, data = cv2.imencode(".png", image, [cv2.IMWRITE_PNG_COMPRESSION, config.PNG_COMPRESSION])
+        if not ok:
+            raise ValueError("Could not encode png output")
+        return data.tobytes()
+
+    if indices is None:
+        indices, full_palette = palette_indices(image, palette)
+    else:
+        full_palette = np.asarray(palette, dtype=np.uint8)
+    indexed_image = Image.fromarray(indices, mode="P")
+    indexed_image.putpalette(full_palette[:, ::-1].ravel().tolist())
+    buffer = io.BytesIO()
+    indexed_image.save(buffer, format="PNG", compress_level=config.PNG_COMPRESSION)
+    return buffer.getvalue()
+
+
+def encode_image(image, output_format, quality, palette=None, indices=None):
+    """Encode a BGR image as PNG, WebP or progressive JPEG"""
+    if output_format == "png":
+        return encode_png(image, palette, indices)
+    if output_format == "webp":
+        ok, data = cv2.imencode(".webp", image, [cv2.IMWRITE_WEBP_QUALITY, quality])
+    elif output_format == "jpeg":
+        ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, min(quality, 100),
+                                                cv2.IMWRITE_JPEG_PROGRESSIVE, 1,
+                                                cv2.IMWRITE_JPEG_OPTIMIZE, 1])
+    else:
+        raise ValueError(f"Unknown output format {output_format}")
+    if not ok:
+        raise ValueError(f"Could not encode {output_format} output")
+    return data.tobytes()
+
+
+def resize_to_width(image, width):
+    """Downscale an image to width, keeping its aspect ratio; smaller images are returned as is"""
+    h, w = image.shape[:2]
+    if w <= width:
+        return image
+    return cv2.resize(image, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+
+
+def write_file(path, data):
+    """Write bytes atomically so the static mount never serves a partial image"""
+    temp_path = path.with_name(f".{path.name}.tmp")
+    temp_path.write_bytes(data)
+    os.replace(temp_path, path)
+
+
+def write_outputs(output_dir, base_name, outline_image, filled_image, palette=None, indices=None):
+    """Encode the full-size outputs plus previews and a thumbnail in one pass
+
+    Full-size images use OUTPUT_FORMAT; PNGs are indexed against palette
+    when given, straight from indices (the outline and filled index images)
+    when the caller has them. Previews and the thumbnail are downscaled from
+    the same arrays and use PREVIEW_FORMAT. Returns the written filenames
+    keyed by Upload column.
+    """
+    outline_indices, filled_indices = indices or (None, None)
+    output_dir = Path(output_dir)
+    full_ext = EXTENSIONS[config.OUTPUT_FORMAT]
+    preview_ext = EXTENSIONS[config.PREVIEW_FORMAT]
+
+    outputs = {
+        "processed_filename": (f"processed_{base_name}{full_ext}", outline_image, config.OUTPUT_FORMAT,
+                               config.OUTPUT_QUALITY, palette, outline_indices),
+        "filled_filename": (f"processed_filled_{base_name}{full_ext}", filled_image, config.OUTPUT_FORMAT,
+                            config.OUTPUT_QUALITY, palette, filled_indices),
+        "preview_filename": (f"preview_{base_name}{preview_ext}", resize_to_width(outline_image, config.PREVIEW_WIDTH),
+                             config.PREVIEW_FORMAT, config.PREVIEW_QUALITY, None, None),
+        "filled_preview_filename": (f"preview_filled_{base_name}{preview_ext}",
+                                    resize_to_width(filled_image, config.PREVIEW_WIDTH),
+                                    config.PREVIEW_FORMAT, config.PREVIEW_QUALITY, None, None),
+    }
+    # The thumbnail is cut from the filled preview rather than the full image
+    outputs["thumbnail_filename"] = (f"thumbnail_{base_name}{preview_ext}",
+                                     resize_to_width(outputs["filled_preview_filename"][1], config.THUMBNAIL_WIDTH),
+                                     config.PREVIEW_FORMAT, config.PREVIEW_QUALITY, None, None)
+
+    filenames = {}
+    for column, (filename, image, output_format, quality, image_palette, image_indices) in outputs.items():
+        write_file(output_dir / filename, encode_image(image, output_format, quality, image_palette, image_indices))
+        filenames[column] = filename
+    return filenames
@@ -0,0 +1,52 @@
+import io
+from PIL import Image, UnidentifiedImageError
+from pillow_heif import register_heif_opener
+from .core import config
+
+# Register HEIF opener with Pillow
+register_heif_opener()
+
+# Formats the worker can decode
+SUPPORTED_FORMATS = {"JPEG", "PNG", "WEBP", "BMP", "TIFF", "GIF", "HEIF"}
+
+
+def is_isobmff(data: bytes) -> bool:
+    """Whether data starts like an ISOBMFF file (HEIC/HEIF), whose image data may precede or span its metadata"""
+    return data[4:8] == b"ftyp"
+
+
+def probe_image_header(data: bytes):
+    """Read format and dimensions from the first bytes of an image without decoding pixels
+
+    Raises ValueError for data that is not a supported image or whose
+    dimensions exceed the configured pixel limit.
+    """
+    return probe_image(io.BytesIO(data))
+
+
+def probe_image_file(path):
+    """Read format and dimensions of a complete image file without decoding pixels
+
+    HEIF readers need the whole container, so HEIC uploads are probed once
+    they are fully written. Raises ValueError like probe_image_header.
+    """
+    return probe_image(path)
+
+
+def probe_image(source):
+    """Format and dimensions of an image read from a path or file object"""
+    try:
+        with Image.open(source) as img:
+            image_format, (width, height) = img.format, img.size
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        raise ValueError("File is not a readable image") from e
+    except Image.DecompressionBombError as e:
+        raise ValueError("Image dimensions are too large") from e
+
+    if image_format not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported image format {image_format}")
+    if width <= 0 or height <= 0:
+        raise ValueError("Image has no pixels")
+    if width * height > config.MAX_IMAGE_PIXELS:
+        raise ValueError(f"Image is {width}x{height}, larger than the {config.MAX_IMAGE_PIXELS} pixel limit")
+    return image_format, width, height
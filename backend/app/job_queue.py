@@ -1,40 +1,340 @@
+import os
 import redis
 import json
 import time
 from typing import Optional
+from .core import config
+
+# Priority lanes, highest weight first. Interactive keeps the original queue key
+# so jobs queued before lanes existed are still picked up.
+LANES = ("preview", "interactive", "rerender", "batch")
+DEFAULT_LANE = "interactive"
+
+# Fast preview jobs are queued as the upload id behind this prefix, so an
+# upload's preview and full render can wait in the queue at the same time
+PREVIEW_JOB_PREFIX = "preview:"
+
+# Claim up to ARGV[1] jobs from the lane lists in the given order, leasing each
+# and recording how long it waited in its lane (in the lane stats and per job).
+# One wake-up token is consumed per claimed job (less the ARGV[3] the caller
+# already popped while blocking), and all of them once every lane is empty, so
+# tokens never outlive the jobs that pushed them.
+CLAIM_SCRIPT = """
+local count = tonumber(ARGV[1])
+local lease = tonumber(ARGV[2])
+local popped = tonumber(ARGV[3])
+local n_lanes = (#KEYS - 5) / 2
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local claimed = {}
+for i = 1, n_lanes do
+    local lane_key = KEYS[5 + i]
+    local stats_key = KEYS[5 + n_lanes + i]
+    while #claimed < count do
+        local upload_id = redis.call('LMOVE', lane_key, KEYS[1], 'RIGHT', 'LEFT')
+        if not upload_id then
+            break
+        end
+        redis.call('ZADD', KEYS[2], now + lease, upload_id)
+        redis.call('HINCRBY', stats_key, 'dequeued', 1)
+        local enqueued_at = redis.call('HGET', KEYS[3], upload_id)
+        if enqueued_at then
+            redis.call('HDEL', KEYS[3], upload_id)
+            local wait = now - tonumber(enqueued_at)
+            redis.call('HINCRBYFLOAT', stats_key, 'wait_total', wait)
+            redis.call('HSET', KEYS[4], upload_id, wait)
+            if wait > tonumber(redis.call('HGET', stats_key, 'wait_max') or '0') then
+                redis.call('HSET', stats_key, 'wait_max', wait)
+            end
+        end
+        table.insert(claimed, upload_id)
+    end
+end
+local waiting = 0
+for i = 1, n_lanes do
+    waiting = waiting + redis.call('LLEN', KEYS[5 + i])
+end
+if waiting == 0 then
+    redis.call('DEL', KEYS[5])
+elseif #claimed > popped then
+    redis.call('LTRIM', KEYS[5], #claimed - popped, -1)
+end
+return claimed
+"""
+
+# Move a job from processing back to the front of its lane, only if it is still in progress
+REQUEUE_SCRIPT = """
+if redis.call('LREM', KEYS[1], 1, ARGV[1]) > 0 then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+_pool = None
+_pool_pid = None
+
+def connection_pool() -> redis.ConnectionPool:
+    """Redis connection pool shared by every JobQueue in this process, recreated after a fork"""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = redis.ConnectionPool.from_url(config.REDIS_URL, decode_responses=True)
+        _pool_pid = os.getpid()
+    return _pool
 
 class JobQueue:
-    def __init__(self, redis_url: str = "redis://localhost:6379"):
-        self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+    def __init__(self, redis_url: str = None, lane_weights: dict = None):
+        # Queues on the configured server share one pool, so creating one per request is cheap
+        if redis_url:
+            self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+        else:
+            self.redis = redis.Redis(connection_pool=connection_pool())
         self.queue_key = "image_processing_queue"
         self.processing_key = "image_processing_in_progress"
         self.failed_key = "image_processing_failed"
+        self.leases_key = "image_processing_leases"  # Sorted set of upload_id -> lease expiry
+        self.attempts_key = "image_processing_attempts"
+        self.lanes_key = "image_processing_lanes"  # Hash of upload_id -> lane
+        self.enqueued_at_key = "image_processing_enqueued_at"  # Hash of upload_id -> enqueue time
+        self.waits_key = "image_processing_waits"  # Hash of claimed upload_id -> seconds it waited
+        self.wakeup_key = "image_processing_wakeup"  # Tokens that wake blocked workers
+
+        # Smooth weighted round robin state for fair dequeueing across lanes
+        self.lane_weights = lane_weights or config.LANE_WEIGHTS
+        self._lane_credit = {lane: 0 for lane in LANES}
+
+        self._claim = self.redis.register_script(CLAIM_SCRIPT)
+        self._requeue = self.redis.register_script(REQUEUE_SCRIPT)
+
+    def lane_key(self, lane: str) -> str:
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane {lane!r}, expected one of {LANES}")
+        return self.queue_key if lane == DEFAULT_LANE else f"{self.queue_key}:{lane}"
+
+    def stats_key(self, lane: str) -> str:
+        return f"image_processing_stats:{lane}"
 
-    def enqueue(self, upload_id: str) -> bool:
+    def enqueue(self, upload_id: str, lane: str = DEFAULT_LANE) -> bool:
+        return self.enqueue_many([upload_id], lane=lane)
+
+    def enqueue_many(self, upload_ids: list, lane: str = DEFAULT_LANE) -> bool:
+        """Enqueue several jobs on a lane in one round trip"""
+        if not upload_ids:
+            return True
         try:
-            return bool(self.redis.lpush(self.queue_key, upload_id))
+            now = time.time()
+            pipe = self.redis.pipeline()
+            pipe.lpush(self.lane_key(lane), *upload_ids)
+            pipe.hset(self.enqueued_at_key, mapping={upload_id: now for upload_id in upload_ids})
+            pipe.hset(self.lanes_key, mapping={upload_id: lane for upload_id in upload_ids})
+            # Wake blocked workers; the token list only needs to cover idle workers
+            pipe.lpush(self.wakeup_key, *range(len(upload_ids)))
+            pipe.ltrim(self.wakeup_key, 0, 999)
+            return bool(pipe.execute()[0])
         except Exception as e:
             print(f"Error enqueueing job: {e}")
             return False
 
-    def dequeue(self) -> Optional[str]:
+    def lane_order(self) -> list:
+        """Lanes in the order to try next, chosen by smooth weighted round robin"""
+        total = 0
+        for lane in LANES:
+            weight = self.lane_weights.get(lane, 1)
+            self._lane_credit[lane] += weight
+            total += weight
+        preferred = max(LANES, key=lambda lane: self._lane_credit[lane])
+        self._lane_credit[preferred] -= total
+        return [preferred] + [lane for lane in LANES if lane != preferred]
+
+    def cancel(self, upload_id: str) -> bool:
+        """Withdraw an upload's waiting jobs, returning whether its full render was still queued"""
+        try:
+            job_ids = [upload_id, preview_job_id(upload_id)]
+            pipe = self.redis.pipeline()
+            for lane in LANES:
+                pipe.lrem(self.lane_key(lane), 0, upload_id)
+            for lane in LANES:
+                pipe.lrem(self.lane_key(lane), 0, job_ids[1])
+            pipe.hdel(self.enqueued_at_key, *job_ids)
+            pipe.hdel(self.lanes_key, *job_ids)
+            return sum(pipe.execute()[:len(LANES)]) > 0
+        except Exception as e:
+            print(f"Error cancelling job: {e}")
+            return False
+
+    def dequeue_many(self, count: int, tokens_popped: int = 0) -> list:
+        """Claim up to count jobs in a single round trip without blocking
+
+        tokens_popped counts wake-up tokens the caller already consumed, so
+        they are not taken again for the claimed jobs.
+        """
+        try:
+            lanes = self.lane_order()
+            keys = ([self.processing_key, self.leases_key, self.enqueued_at_key, self.waits_key, self.wakeup_key]
+                    + [self.lane_key(lane) for lane in lanes]
+                    + [self.stats_key(lane) for lane in lanes])
+            return self._claim(keys=keys, args=[count, config.JOB_LEASE_SECONDS, tokens_popped])
+        except Exception as e:
+            print(f"Error dequeuing jobs: {e}")
+            return []
+
+    def dequeue(self, timeout: float = 0) -> Optional[str]:
+        """Claim the next job, blocking up to timeout seconds while every lane is empty
+
+        A timeout of 0 returns immediately. The claimed job gets a lease that
+        must be renewed with heartbeat() or it is requeued by requeue_expired().
+        """
+        deadline = time.time() + timeout
+        tokens_popped = 0
+        while True:
+            claimed = self.dequeue_many(1, tokens_popped)
+            if claimed:
+                return claimed[0]
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            try:
+                # Sleep until a job is enqueued on any lane
+                if not self.redis.blpop(self.wakeup_key, timeout=remaining):
+                    return None
+                tokens_popped = 1
+            except Exception as e:
+                print(f"Error dequeuing job: {e}")
+                return None
+
+    def claim_info(self, upload_id: str) -> tuple:
+        """Seconds a claimed job waited in its lane and the lane's name (None when unknown)"""
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hget(self.waits_key, upload_id)
+            pipe.hdel(self.waits_key, upload_id)
+            pipe.hget(self.lanes_key, upload_id)
+            wait, _, lane = pipe.execute()
+            return (float(wait) if wait is not None else None), lane
+        except Exception as e:
+            print(f"Error reading claim info: {e}")
+            return None, None
+
+    def heartbeat(self, upload_id: str, lease_seconds: float = None):
+        """Extend the lease of a job that is still being processed"""
+        lease_seconds = lease_seconds or config.JOB_LEASE_SECONDS
         try:
-            # Atomic move from queue to processing
-            upload_id = self.redis.rpoplpush(self.queue_key, self.processing_key)
-            return upload_id
+            self.redis.zadd(self.leases_key, {upload_id: time.time() + lease_seconds})
         except Exception as e:
-            print(f"Error dequeuing job: {e}")
-            return None
+            print(f"Error renewing lease: {e}")
 
     def complete_job(self, upload_id: str):
         try:
-            self.redis.lrem(self.processing_key, 1, upload_id)
+            pipe = self.redis.pipeline()
+            pipe.lrem(self.processing_key, 1, upload_id)
+            pipe.zrem(self.leases_key, upload_id)
+            pipe.hdel(self.attempts_key, upload_id)
+            pipe.hdel(self.lanes_key, upload_id)
+            pipe.execute()
         except Exception as e:
             print(f"Error completing job: {e}")
 
     def fail_job(self, upload_id: str, error: str):
         try:
-            self.redis.lrem(self.processing_key, 1, upload_id)
-            self.redis.hset(self.failed_key, upload_id, error)
+            pipe = self.redis.pipeline()
+            pipe.lrem(self.processing_key, 1, upload_id)
+            pipe.zrem(self.leases_key, upload_id)
+            pipe.hdel(self.attempts_key, upload_id)
+            pipe.hdel(self.lanes_key, upload_id)
+            pipe.hset(self.failed_key, upload_id, error)
+            pipe.execute()
+        except Exception as e:
+            print(f"Error failing job: {e}")
+
+    def release(self, upload_id: str) -> bool:
+        """Return a claimed but unstarted job to the front of its lane"""
+        try:
+            lane = self.redis.hget(self.lanes_key, upload_id) or DEFAULT_LANE
+            self.redis.zrem(self.leases_key, upload_id)
+            requeued = bool(self._requeue(keys=[self.processing_key, self.lane_key(lane)], args=[upload_id]))
+            if requeued:
+                self.redis.lpush(self.wakeup_key, 0)
+            return requeued
+        except Exception as e:
+            print(f"Error releasing job: {e}")
+            return False
+
+    def requeue_expired(self, max_attempts: int = None) -> tuple:
+        """Requeue jobs whose lease expired, e.g. because their worker crashed
+
+        Jobs found in the processing list without any lease (left behind by a
+        crash between claiming and leasing) are given one, so they are
+        reclaimed on a later pass if nobody picks them up. Jobs that keep
+        expiring are failed after max_attempts. Returns the requeued ids and
+        the (id, error) pairs of the failed jobs, whose uploads the caller
+        still has to mark as failed.
+        """
+        max_attempts = max_attempts or config.MAX_JOB_ATTEMPTS
+        requeued, failed = [], []
+        try:
+            # Lease orphaned in-progress jobs so they expire like any other
+            in_progress = self.redis.lrange(self.processing_key, 0, -1)
+            if in_progress:
+                expiry = time.time() + config.JOB_LEASE_SECONDS
+                self.redis.zadd(self.leases_key, {upload_id: expiry for upload_id in in_progress}, nx=True)
+
+            for upload_id in self.redis.zrangebyscore(self.leases_key, "-inf", time.time()):
+                # Only the caller that removes the lease reclaims the job
+                if not self.redis.zrem(self.leases_key, upload_id):
+                    continue
+                # Skip jobs that finished after their lease was read
+                if self.redis.lpos(self.processing_key, upload_id) is None:
+                    continue
+                attempts = self.redis.hincrby(self.attempts_key, upload_id, 1)
+                if attempts >= max_attempts:
+                    error = f"Lease expired {attempts} times"
+                    self.fail_job(upload_id, error)
+                    failed.append((upload_id, error))
+                    continue
+                lane = self.redis.hget(self.lanes_key, upload_id) or DEFAULT_LANE
+                if self._requeue(keys=[self.processing_key, self.lane_key(lane)], args=[upload_id]):
+                    self.redis.lpush(self.wakeup_key, 0)
+                    requeued.append(upload_id)
         except Exception as e:
-            print(f"Error failing job: {e}") 
\ No newline at end of file
+            print(f"Error requeueing expired jobs: {e}")
+        return requeued, failed
+
+    def stats(self) -> dict:
+        """Depth, dequeue count and wait times (seconds) per lane"""
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        for lane in LANES:
+            pipe.llen(self.lane_key(lane))
+            pipe.lindex(self.lane_key(lane), -1)  # Oldest waiting job
+            pipe.hgetall(self.stats_key(lane))
+        results = pipe.execute()
+
+        oldest_ids = [results[i * 3 + 1] for i in range(len(LANES))]
+        oldest_times = self.redis.hmget(self.enqueued_at_key, [upload_id or "" for upload_id in oldest_ids]) if any(oldest_ids) else []
+
+        stats = {}
+        for i, lane in enumerate(LANES):
+            depth, oldest_id, counters = results[i * 3:i * 3 + 3]
+            dequeued = int(counters.get("dequeued", 0))
+            wait_total = float(counters.get("wait_total", 0))
+            oldest_at = oldest_times[i] if oldest_id and oldest_times else None
+            stats[lane] = {
+                "depth": depth,
+                "dequeued": dequeued,
+                "avgWait": wait_total / dequeued if dequeued else 0.0,
+                "maxWait": float(counters.get("wait_max", 0)),
+                "oldestWait": now - float(oldest_at) if oldest_at else 0.0,
+            }
+        stats["inProgress"] = self.redis.llen(self.processing_key)
+        return stats
+
+def enqueue_processing(upload_id: str, lane: str = DEFAULT_LANE) -> bool:
+    """Enqueue an image for processing on a priority lane"""
+    return JobQueue().enqueue(upload_id, lane=lane)
+
+def preview_job_id(upload_id: str) -> str:
+    return f"{PREVIEW_JOB_PREFIX}{upload_id}"
+
+def enqueue_preview(upload_id: str) -> bool:
+    """Enqueue the fast low-resolution preview of an upload ahead of its full render"""
+    return JobQueue().enqueue(preview_job_id(upload_id), lane="preview")
@@ -1,16 +1,31 @@
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Form, Query, Request, Body
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+from typing import List, NamedTuple, Optional
 from pathlib import Path
-import shutil
+import base64
+import hashlib
+import json
 import os
+import tempfile
 import uuid
+import zipfile
+import zlib
+import redis.asyncio as aioredis
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, or_, and_
+from .core import config
 from .core.database import get_db, init_db
+from .core.middleware import BodySizeLimitMiddleware
+from .image_probe import is_isobmff, probe_image_file, probe_image_header
 from .models.upload import Upload, ProcessingStatus
-from .worker import enqueue_processing
+from .job_queue import JobQueue, enqueue_preview, enqueue_processing
+from .metrics import render_metrics
+from .progress import TERMINAL_STAGES, last_event_key, progress_channel, publish_progress
+from .options import QUANTIZERS, VECTOR_FORMATS
 import logging
 
 # Configure logging
@@ -28,21 +43,186 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized uploads while they stream in (with headroom for multipart framing)
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={"/api/upload": config.MAX_UPLOAD_BYTES + 64 * 1024, "/api/uploads/batch": config.MAX_BATCH_BYTES},
+)
+
 # Create uploads directory if it doesn't exist
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Bytes read per chunk while saving and hashing uploads
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Archive members taken as images in batch uploads; anything else is skipped
+ARCHIVE_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff", ".gif", ".heic", ".heif"}
+
+# Seconds between keep-alive comments on idle event streams
+EVENT_KEEPALIVE_SECONDS = 15
+
 # Mount the uploads directory
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
+# Connection pool shared by every async Redis client of this process
+redis_pool = None
+
+def get_redis() -> aioredis.Redis:
+    """Async Redis client on the process's shared connection pool"""
+    global redis_pool
+    if redis_pool is None:
+        redis_pool = aioredis.ConnectionPool.from_url(config.REDIS_URL, decode_responses=True)
+    return aioredis.Redis(connection_pool=redis_pool)
+
+async def save_upload(file: UploadFile, temp_location: Path) -> str:
+    """Stream an upload to disk without blocking the event loop, returning its SHA-256
+
+    The image header in the first chunk is validated before anything else is
+    written, and the byte limit is enforced as chunks arrive. HEIC/HEIF
+    containers can only be read whole, so they are validated once written.
+    Raises ValueError (after removing the partial file) if a check fails.
+    """
+    if file.size is not None and file.size > config.MAX_UPLOAD_BYTES:
+        raise ValueError(f"File exceeds the {config.MAX_UPLOAD_BYTES} byte limit")
+    
+    hasher = hashlib.sha256()
+    size = 0
+    probe_whole_file = False
+    file_object = await run_in_threadpool(open, temp_location, "wb")
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            if size == 0:
+                probe_whole_file = is_isobmff(chunk)
+                if not probe_whole_file:
+                    # Reject undecodable or oversized images before persisting anything
+                    await run_in_threadpool(probe_image_header, chunk)
+            size += len(chunk)
+            if size > config.MAX_UPLOAD_BYTES:
+                raise ValueError(f"File exceeds the {config.MAX_UPLOAD_BYTES} byte limit")
+            hasher.update(chunk)
+            await run_in_threadpool(file_object.write, chunk)
+        if size == 0:
+            raise ValueError("File is empty")
+        await run_in_threadpool(file_object.close)
+        if probe_whole_file:
+            await run_in_threadpool(probe_image_file, temp_location)
+    except BaseException:
+        await run_in_threadpool(file_object.close)
+        temp_location.unlink(missing_ok=True)
+        raise
+    return hasher.hexdigest()
+
+async def store_upload(file: UploadFile) -> tuple:
+    """Save a validated upload under its content-addressed name, returning (filename, content_hash)
+
+    Identical images are stored once. Raises ValueError if the file fails
+    validation (see save_upload).
+    """
+    file_extension = os.path.splitext(file.filename or "")[1].lower()
+    temp_location = UPLOAD_DIR / f".{uuid.uuid4()}.part"
+    content_hash = await save_upload(file, temp_location)
+    
+    unique_filename = f"{content_hash}{file_extension}"
+    file_location = UPLOAD_DIR / unique_filename
+    if file_location.exists():
+        temp_location.unlink()
+    else:
+        await run_in_threadpool(os.replace, temp_location, file_location)
+    return unique_filename, content_hash
+
+class ArchiveMember(NamedTuple):
+    """An image member of an uploaded zip archive, decompressed only when it is stored"""
+    archive: zipfile.ZipFile
+    info: zipfile.ZipInfo
+
+    @property
+    def filename(self) -> str:
+        return Path(self.info.filename).name
+
+def archive_members(archive: UploadFile) -> list:
+    """Image members of an uploaded zip archive"""
+    archive_file = zipfile.ZipFile(archive.file)
+    members = []
+    for info in archive_file.infolist():
+        path = Path(info.filename)
+        if info.is_dir() or path.parts[0] == "__MACOSX" or path.suffix.lower() not in ARCHIVE_IMAGE_EXTENSIONS:
+            continue
+        members.append(ArchiveMember(archive_file, info))
+    return members
+
+def extract_member(member: ArchiveMember) -> UploadFile:
+    """Decompress an archive member into a spooled temporary file, as an upload
+
+    Blocking; run it in the threadpool so decompression stays off the event
+    loop. Copying stops one byte past the upload limit, which store_upload
+    then rejects, so a member's declared size is never trusted.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_CHUNK_SIZE)
+    remaining = config.MAX_UPLOAD_BYTES + 1
+    with member.archive.open(member.info) as source:
+        while remaining > 0:
+            chunk = source.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            spool.write(chunk)
+            remaining -= len(chunk)
+    size = spool.tell()
+    spool.seek(0)
+    return UploadFile(spool, size=size, filename=member.filename)
+
+def reusable_uploads(content_hashes, color_count: int, quantizer: Optional[str], vector_format: Optional[str]):
+    """Completed uploads of these contents rendered with the same options, newest first"""
+    return (
+        select(Upload)
+        .filter(Upload.content_hash.in_(content_hashes),
+                Upload.color_count == color_count,
+                Upload.quantizer.is_(None) if quantizer is None else Upload.quantizer == quantizer,
+                Upload.vector_format.is_(None) if vector_format is None else Upload.vector_format == vector_format,
+                Upload.status == ProcessingStatus.COMPLETED)
+        .order_by(Upload.uploaded_at.desc())
+    )
+
+def create_upload(filename: str, original_name: str, content_hash: str, color_count: int,
+                  quantizer: Optional[str], vector_format: Optional[str], existing: Optional[Upload] = None) -> Upload:
+    """New upload record, already completed with the outputs of existing when given"""
+    db_upload = Upload(
+        id=str(uuid.uuid4()),
+        filename=filename,
+        original_name=original_name,
+        content_hash=content_hash,
+        status=ProcessingStatus.PENDING,
+        color_count=color_count,
+        quantizer=quantizer,
+        vector_format=vector_format
+    )
+    if existing:
+        db_upload.status = ProcessingStatus.COMPLETED
+        db_upload.processed_filename = existing.processed_filename
+        db_upload.filled_filename = existing.filled_filename
+        db_upload.preview_filename = existing.preview_filename
+        db_upload.filled_preview_filename = existing.filled_preview_filename
+        db_upload.thumbnail_filename = existing.thumbnail_filename
+        db_upload.fast_preview_filename = existing.fast_preview_filename
+        db_upload.palette_filename = existing.palette_filename
+        db_upload.source_id = existing.id
+    return db_upload
+
 @app.on_event("startup")
 async def startup_event():
     await init_db()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    if redis_pool is not None:
+        await redis_pool.disconnect()
+
 @app.post("/api/upload")
 async def upload_image(
     file: UploadFile = File(...),
     color_count: int = Form(20, ge=2, le=30),  # Default 20, min 2, max 30
+    quantizer: Optional[str] = Form(None),  # Defaults to the configured engine
+    vector_format: Optional[str] = Form(None),  # "svg" or "pdf" skips the raster outputs
     db: AsyncSession = Depends(get_db)
 ):
     try:
@@ -50,35 +230,52 @@ async def upload_image(
         if not file.content_type.startswith("image/"):
             return {"error": "File must be an image"}
         
-        # Create unique filename with UUID
-        file_extension = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_location = UPLOAD_DIR / unique_filename
+        # Validate quantization engine
+        if quantizer is not None and quantizer not in QUANTIZERS:
+            return {"error": f"Quantizer must be one of: {', '.join(QUANTIZERS)}"}
+        if vector_format is not None and vector_format not in VECTOR_FORMATS:
+            return {"error": f"Vector format must be one of: {', '.join(VECTOR_FORMATS)}"}
         
-        # Save the file
-        with open(file_location, "wb+") as file_object:
-            shutil.copyfileobj(file.file, file_object)
+        # Save the file under its content hash, validating it as it streams in
+        try:
+            unique_filename, content_hash = await store_upload(file)
+        except ValueError as e:
+            return {"error": str(e)}
+        
+        # Reuse the outputs of an identical, already completed request
+        result = await db.execute(reusable_uploads([content_hash], color_count, quantizer, vector_format).limit(1))
+        existing = result.scalar_one_or_none()
         
         # Create database record
-        upload_id = str(uuid.uuid4())
-        db_upload = Upload(
-            id=upload_id,
-            filename=unique_filename,
-            original_name=file.filename,
-            status=ProcessingStatus.PENDING,
-            color_count=color_count
-        )
+        db_upload = create_upload(unique_filename, file.filename, content_hash, color_count, quantizer,
+                                  vector_format, existing)
+        upload_id = db_upload.id
         db.add(db_upload)
         await db.commit()
         logger.info(f"Successfully created upload record with ID: {upload_id}")
 
-        # Enqueue for processing
-        enqueue_processing(upload_id)
+        if existing:
+            logger.info(f"Reused outputs of upload {existing.id} for {upload_id}")
+            return {
+                "id": upload_id,
+                "filename": unique_filename,
+                "colorCount": color_count,
+                "quantizer": quantizer,
+                "vectorFormat": vector_format,
+                "message": "Image already processed"
+            }
+
+        # Enqueue for processing, with a quick low-resolution preview ahead of the full render
+        if config.FAST_PREVIEW_WIDTH:
+            await run_in_threadpool(enqueue_preview, upload_id)
+        await run_in_threadpool(enqueue_processing, upload_id)
             
         return {
             "id": upload_id,
             "filename": unique_filename,
             "colorCount": color_count,
+            "quantizer": quantizer,
+            "vectorFormat": vector_format,
             "message": "Image uploaded and queued for processing"
         }
     except Exception as e:
@@ -86,21 +283,234 @@ async def upload_image(
         await db.rollback()
         return {"error": str(e)}
 
+@app.post("/api/uploads/batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),  # Images and/or zip archives of images
+    color_count: int = Form(20, ge=2, le=30),
+    quantizer: Optional[str] = Form(None),
+    vector_format: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Upload many images at once, with the same options for all of them
+
+    Every image (including the members of zip archives) gets its own upload.
+    All rows are inserted in one transaction and queued on the batch lane in
+    one round trip. Files that fail validation are listed under rejected and
+    do not fail the rest of the batch.
+    """
+    try:
+        if quantizer is not None and quantizer not in QUANTIZERS:
+            return {"error": f"Quantizer must be one of: {', '.join(QUANTIZERS)}"}
+        if vector_format is not None and vector_format not in VECTOR_FORMATS:
+            return {"error": f"Vector format must be one of: {', '.join(VECTOR_FORMATS)}"}
+        
+        # Expand archives into their image members
+        sources, rejected = [], []
+        for file in files:
+            if os.path.splitext(file.filename or "")[1].lower() != ".zip":
+                sources.append(file)
+                continue
+            try:
+                sources.extend(await run_in_threadpool(archive_members, file))
+            except zipfile.BadZipFile:
+                rejected.append({"filename": file.filename, "error": "File is not a readable zip archive"})
+        if len(sources) > config.MAX_BATCH_FILES:
+            return {"error": f"Batch exceeds the {config.MAX_BATCH_FILES} image limit"}
+        
+        # Store every image, keeping the ones that pass validation; archive
+        # members are extracted one at a time as they are stored
+        stored = []
+        for source in sources:
+            try:
+                if isinstance(source, ArchiveMember):
+                    upload = await run_in_threadpool(extract_member, source)
+                    try:
+                        stored.append((source.filename, *await store_upload(upload)))
+                    finally:
+                        await upload.close()
+                else:
+                    stored.append((source.filename, *await store_upload(source)))
+            except (ValueError, zipfile.BadZipFile, zlib.error) as e:
+                rejected.append({"filename": source.filename, "error": str(e)})
+        
+        # Reuse the outputs of identical, already completed requests in one query
+        existing = {}
+        if stored:
+            result = await db.execute(reusable_uploads({content_hash for _, _, content_hash in stored},
+                                                       color_count, quantizer, vector_format))
+            for upload in result.scalars():
+                existing.setdefault(upload.content_hash, upload)
+        
+        # One transaction for all records, then one pipelined enqueue
+        uploads = [create_upload(filename, original_name, content_hash, color_count, quantizer, vector_format,
+                                 existing.get(content_hash))
+                   for original_name, filename, content_hash in stored]
+        db.add_all(uploads)
+        await db.commit()
+        queued = [upload.id for upload in uploads if upload.status == ProcessingStatus.PENDING]
+        if queued and not await run_in_threadpool(JobQueue().enqueue_many, queued, "batch"):
+            logger.error(f"Could not enqueue batch of {len(queued)} uploads")
+        logger.info(f"Created batch of {len(uploads)} uploads, {len(queued)} queued")
+        
+        return {
+            "uploads": [{"id": upload.id, "originalName": upload.original_name, "filename": upload.filename,
+                         "status": upload.status.value} for upload in uploads],
+            "rejected": rejected,
+            "colorCount": color_count,
+            "quantizer": quantizer,
+            "vectorFormat": vector_format,
+            "message": f"{len(queued)} images queued for processing, {len(uploads) - len(queued)} already processed"
+        }
+    except Exception as e:
+        logger.error(f"Error in upload_batch: {str(e)}")
+        await db.rollback()
+        return {"error": str(e)}
+
+@app.post("/api/uploads/status")
+async def get_upload_statuses(ids: List[str] = Body(..., embed=True), db: AsyncSession = Depends(get_db)):
+    """Status of many uploads in one query; unknown ids are listed under missing"""
+    try:
+        if len(ids) > config.MAX_STATUS_IDS:
+            return {"error": f"At most {config.MAX_STATUS_IDS} ids per request"}
+        
+        result = await db.execute(select(Upload).filter(Upload.id.in_(set(ids))))
+        found = {upload.id: upload for upload in result.scalars()}
+        return {
+            "uploads": [found[upload_id].to_dict() for upload_id in ids if upload_id in found],
+            "missing": [upload_id for upload_id in ids if upload_id not in found],
+        }
+    except Exception as e:
+        logger.error(f"Error in get_upload_statuses: {str(e)}")
+        return {"error": str(e)}
+
+def encode_cursor(upload: Upload) -> str:
+    """Opaque keyset cursor pointing just past an upload in listing order"""
+    raw = f"{upload.uploaded_at.isoformat()}|{upload.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    uploaded_at, upload_id = raw.split("|", 1)
+    return datetime.fromisoformat(uploaded_at), upload_id
+
 @app.get("/api/uploads")
-async def get_uploads(db: AsyncSession = Depends(get_db)):
+async def get_uploads(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,  # nextCursor of the previous page
+    status: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
     try:
         logger.info("Fetching uploads from database...")
+        query = select(Upload)
+        if status is not None:
+            try:
+                query = query.filter(Upload.status == ProcessingStatus(status))
+            except ValueError:
+                return {"error": f"Status must be one of: {', '.join(s.value for s in ProcessingStatus)}"}
+        if cursor is not None:
+            try:
+                cursor_uploaded_at, cursor_id = decode_cursor(cursor)
+            except ValueError:
+                return {"error": "Invalid cursor"}
+            # Keyset pagination: rows strictly after the cursor in (uploaded_at, id) order
+            query = query.filter(or_(
+                Upload.uploaded_at < cursor_uploaded_at,
+                and_(Upload.uploaded_at == cursor_uploaded_at, Upload.id < cursor_id)
+            ))
+        
+        # Fetch one extra row to know whether another page exists
         result = await db.execute(
-            select(Upload).order_by(Upload.uploaded_at.desc())
+            query.order_by(Upload.uploaded_at.desc(), Upload.id.desc()).limit(limit + 1)
         )
         uploads = result.scalars().all()
-        uploads_list = [upload.to_dict() for upload in uploads]
+        next_cursor = encode_cursor(uploads[limit - 1]) if len(uploads) > limit else None
+        uploads_list = [upload.to_dict() for upload in uploads[:limit]]
         logger.info(f"Found {len(uploads_list)} uploads")
-        return {"uploads": uploads_list}
+        return {"uploads": uploads_list, "nextCursor": next_cursor}
     except Exception as e:
         logger.error(f"Error in get_uploads: {str(e)}")
         return {"error": str(e)}
 
+def format_event(event: dict) -> str:
+    return f"event: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+
+async def open_upload_events(ids: List[str], db: AsyncSession):
+    """Subscribe to uploads' progress channels and build each one's initial event
+
+    Returns the subscription and the initial events, which come from the
+    database annotated with the latest known stage; unknown ids get a
+    missing event.
+    """
+    # Subscribe before reading the current state so no event is missed in between
+    client = get_redis()
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(*[progress_channel(upload_id) for upload_id in ids])
+        result = await db.execute(select(Upload).filter(Upload.id.in_(set(ids))))
+        found = {upload.id: upload for upload in result.scalars()}
+        last_events = await client.mget([last_event_key(upload_id) for upload_id in ids])
+    except Exception:
+        await pubsub.aclose()
+        raise
+    
+    initial = []
+    for upload_id, last_event in zip(ids, last_events):
+        upload = found.get(upload_id)
+        if upload is None:
+            initial.append({"id": upload_id, "stage": "missing"})
+            continue
+        stage = {ProcessingStatus.COMPLETED: "done", ProcessingStatus.FAILED: "failed"}.get(upload.status)
+        if stage is None:
+            stage = json.loads(last_event)["stage"] if last_event else upload.status.value
+        initial.append({"id": upload_id, "stage": stage, "upload": upload.to_dict()})
+    return pubsub, initial
+
+def event_response(pubsub, initial: List[dict], request: Request) -> StreamingResponse:
+    """Stream the initial events, then live ones until every upload is done, failed or missing"""
+    async def event_stream():
+        try:
+            live = set()
+            for event in initial:
+                yield format_event(event)
+                if event["stage"] in TERMINAL_STAGES or event["stage"] == "missing":
+                    await pubsub.unsubscribe(progress_channel(event["id"]))
+                else:
+                    live.add(event["id"])
+            while live and not await request.is_disconnected():
+                message = await pubsub.get_message(ignore_subscribe_messages=True,
+                                                   timeout=EVENT_KEEPALIVE_SECONDS)
+                if message is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                event = json.loads(message["data"])
+                yield format_event(event)
+                if event["stage"] in TERMINAL_STAGES:
+                    live.discard(event["id"])
+                    await pubsub.unsubscribe(progress_channel(event["id"]))
+        finally:
+            await pubsub.aclose()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/uploads/events")
+async def stream_uploads_events(request: Request, ids: List[str] = Query(...),
+                                db: AsyncSession = Depends(get_db)):
+    """One Server-Sent Events stream multiplexing the stage events of many uploads
+
+    Every event carries its upload's id. A page follows all its uploads over
+    this single connection instead of one stream per upload.
+    """
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > config.MAX_EVENT_STREAM_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {config.MAX_EVENT_STREAM_IDS} ids per stream")
+    pubsub, initial = await open_upload_events(ids, db)
+    return event_response(pubsub, initial, request)
+
 @app.get("/api/uploads/{upload_id}")
 async def get_upload_status(upload_id: str, db: AsyncSession = Depends(get_db)):
     try:
@@ -119,6 +529,123 @@ async def get_upload_status(upload_id: str, db: AsyncSession = Depends(get_db)):
         logger.error(f"Error in get_upload_status: {str(e)}")
         return {"error": str(e)}
 
+@app.get("/api/uploads/{upload_id}/events")
+async def stream_upload_events(upload_id: str, request: Request, db: AsyncSession = Depends(get_db)):
+    """Server-Sent Events stream of an upload's processing stages until it is done or failed"""
+    pubsub, initial = await open_upload_events([upload_id], db)
+    if initial[0]["stage"] == "missing":
+        await pubsub.aclose()
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return event_response(pubsub, initial, request)
+
+@app.post("/api/uploads/{upload_id}/rerender")
+async def rerender_upload(
+    upload_id: str,
+    color_count: int = Form(..., ge=2, le=30),
+    vector_format: Optional[str] = Form(None),  # "svg", "pdf" or "raster"; defaults to the source's
+    db: AsyncSession = Depends(get_db)
+):
+    """Re-render a processed upload with a different color count from its stored palette"""
+    try:
+        if vector_format is not None and vector_format not in VECTOR_FORMATS + ("raster",):
+            return {"error": f"Vector format must be one of: {', '.join(VECTOR_FORMATS + ('raster',))}"}
+        
+        result = await db.execute(
+            select(Upload).filter(Upload.id == upload_id)
+        )
+        source = result.scalar_one_or_none()
+        
+        if not source:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        if not source.palette_filename:
+            raise HTTPException(status_code=409, detail="Upload has not been processed yet")
+        
+        # Keep the source's output type unless asked for another one
+        if vector_format is None:
+            vector_format = source.vector_format
+        elif vector_format == "raster":
+            vector_format = None
+        
+        # New record sharing the input file and palette hierarchy of the source
+        rerender_id = str(uuid.uuid4())
+        db_upload = Upload(
+            id=rerender_id,
+            filename=source.filename,
+            original_name=source.original_name,
+            content_hash=source.content_hash,
+            status=ProcessingStatus.PENDING,
+            color_count=color_count,
+            quantizer=source.quantizer,
+            vector_format=vector_format,
+            palette_filename=source.palette_filename,
+            source_id=source.id
+        )
+        db.add(db_upload)
+        await db.commit()
+        logger.info(f"Created re-render {rerender_id} of upload {upload_id}")
+        
+        # Enqueue for rendering; the worker skips straight to the stored palette
+        await run_in_threadpool(enqueue_processing, rerender_id, lane="rerender")
+        
+        return {
+            "id": rerender_id,
+            "sourceId": upload_id,
+            "colorCount": color_count,
+            "vectorFormat": vector_format,
+            "message": "Re-render queued"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in rerender_upload: {str(e)}")
+        await db.rollback()
+        return {"error": str(e)}
+
+@app.post("/api/uploads/{upload_id}/cancel")
+async def cancel_upload(upload_id: str, db: AsyncSession = Depends(get_db)):
+    """Cancel an upload whose full render has not started yet"""
+    try:
+        result = await db.execute(select(Upload).filter(Upload.id == upload_id))
+        upload = result.scalar_one_or_none()
+        if not upload:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        
+        # Only a job still waiting in its lane can be withdrawn
+        if upload.status != ProcessingStatus.PENDING or not await run_in_threadpool(JobQueue().cancel, upload_id):
+            raise HTTPException(status_code=409, detail="Upload is already being processed")
+        
+        upload.status = ProcessingStatus.FAILED
+        upload.error_message = "Cancelled"
+        await db.commit()
+        await db.refresh(upload)
+        await run_in_threadpool(publish_progress, upload_id, "failed", error="Cancelled", upload=upload.to_dict())
+        return {"id": upload_id, "message": "Upload cancelled"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in cancel_upload: {str(e)}")
+        await db.rollback()
+        return {"error": str(e)}
+
+@app.get("/api/queue/stats")
+async def get_queue_stats():
+    """Per-lane queue depth and wait times"""
+    try:
+        return await run_in_threadpool(JobQueue().stats)
+    except Exception as e:
+        logger.error(f"Error in get_queue_stats: {str(e)}")
+        return {"error": str(e)}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Queue depth, in-flight jobs and job histograms in the Prometheus text format"""
+    try:
+        return PlainTextResponse(await run_in_threadpool(render_metrics),
+                                 media_type="text/plain; version=0.0.4")
+    except Exception as e:
+        logger.error(f"Error in get_metrics: {str(e)}")
+        return {"error": str(e)}
+
 @app.get("/")
 async def root():
     return {"message": "Image Upload API is running"}
@@ -0,0 +1,147 @@
+import logging
+import re
+import resource
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+from .job_queue import LANES, JobQueue
+from .progress import get_client
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RSS_BUCKETS = tuple(2 ** power * 1024 ** 2 for power in range(6, 14))  # 64 MB to 8 GB
+FILE_BUCKETS = tuple(4 ** power * 1024 for power in range(3, 10))  # 64 KB to 256 MB
+
+
+@dataclass
+class Histogram:
+    """A Prometheus histogram whose buckets live in a Redis hash
+
+    Every worker process adds its observations to the same hash, so the API
+    process can export fleet-wide distributions. Buckets are stored
+    cumulatively, as they are exported.
+    """
+    name: str
+    help: str
+    buckets: tuple
+    label: Optional[str] = None
+
+    @property
+    def key(self):
+        return f"metrics:{self.name}"
+
+    def observe(self, pipe, value, label_value=""):
+        for bound in self.buckets:
+            if value <= bound:
+                pipe.hincrby(self.key, f"{label_value}|{bound}", 1)
+        pipe.hincrby(self.key, f"{label_value}|+Inf", 1)
+        pipe.hincrbyfloat(self.key, f"{label_value}|sum", value)
+
+    def exposition(self, fields):
+        """Prometheus text lines for the hash fields read back from Redis"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        series = {}
+        for field, value in fields.items():
+            label_value, _, suffix = field.rpartition("|")
+            series.setdefault(label_value, {})[suffix] = value
+        for label_value, values in sorted(series.items()):
+            labels = f'{self.label}="{label_value}"' if self.label else ""
+            for bound in [str(bound) for bound in self.buckets] + ["+Inf"]:
+                bucket_labels = ",".join(filter(None, [labels, f'le="{bound}"']))
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {values.get(bound, 0)}")
+            suffix_labels = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix_labels} {values.get('sum', 0)}")
+            lines.append(f"{self.name}_count{suffix_labels} {values.get('+Inf', 0)}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("pbn_stage_seconds", "Wall time of each pipeline stage", SECONDS_BUCKETS, "stage")
+STAGE_PEAK_RSS = Histogram("pbn_stage_peak_rss_bytes", "Peak worker RSS during each pipeline stage",
+                           RSS_BUCKETS, "stage")
+JOB_SECONDS = Histogram("pbn_job_seconds", "Wall time of a job's pipeline and encoding", SECONDS_BUCKETS)
+QUEUE_WAIT = Histogram("pbn_queue_wait_seconds", "Time a job waited in its lane", SECONDS_BUCKETS, "lane")
+INPUT_BYTES = Histogram("pbn_input_bytes", "Size of processed input files", FILE_BUCKETS)
+OUTPUT_BYTES = Histogram("pbn_output_bytes", "Total size of a job's output files", FILE_BUCKETS)
+HISTOGRAMS = (STAGE_SECONDS, STAGE_PEAK_RSS, JOB_SECONDS, QUEUE_WAIT, INPUT_BYTES, OUTPUT_BYTES)
+
+
+def reset_peak_rss():
+    """Restart peak RSS tracking for this process (Linux only; a no-op elsewhere)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_bytes():
+    """Peak RSS since the last reset_peak_rss(), or since the process started"""
+    try:
+        with open("/proc/self/status") as status:
+            return int(re.search(r"VmHWM:\s+(\d+)", status.read()).group(1)) * 1024
+    except (OSError, AttributeError):
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS; neither can be reset
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class JobMetrics:
+    """Wall time and peak RSS of every stage of one job"""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = {"seconds": round(time.perf_counter() - start, 4),
+                                 "peakRssMb": round(peak_rss_bytes() / 1024 ** 2, 1)}
+
+    def total_seconds(self):
+        return round(sum(stage["seconds"] for stage in self.stages.values()), 4)
+
+
+def record_job(job_metrics, queue_wait=None, lane=None, input_bytes=None, output_bytes=None):
+    """Add a finished job's measurements to the shared histograms; failures are logged and never raised"""
+    try:
+        pipe = get_client().pipeline(transaction=False)
+        for name, stage in job_metrics.stages.items():
+            STAGE_SECONDS.observe(pipe, stage["seconds"], name)
+            STAGE_PEAK_RSS.observe(pipe, stage["peakRssMb"] * 1024 ** 2, name)
+        JOB_SECONDS.observe(pipe, job_metrics.total_seconds())
+        if queue_wait is not None:
+            QUEUE_WAIT.observe(pipe, queue_wait, lane or "")
+        if input_bytes is not None:
+            INPUT_BYTES.observe(pipe, input_bytes)
+        if output_bytes is not None:
+            OUTPUT_BYTES.observe(pipe, output_bytes)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not record job metrics: {e}")
+
+
+def render_metrics(queue=None):
+    """Queue gauges and job histograms in the Prometheus text format"""
+    queue = queue or JobQueue()
+    stats = queue.stats()
+    lines = ["# HELP pbn_queue_depth Jobs waiting in each lane", "# TYPE pbn_queue_depth gauge"]
+    lines += [f'pbn_queue_depth{{lane="{lane}"}} {stats[lane]["depth"]}' for lane in LANES]
+    lines += ["# HELP pbn_queue_oldest_wait_seconds Age of the oldest waiting job in each lane",
+              "# TYPE pbn_queue_oldest_wait_seconds gauge"]
+    lines += [f'pbn_queue_oldest_wait_seconds{{lane="{lane}"}} {stats[lane]["oldestWait"]}' for lane in LANES]
+    lines += ["# HELP pbn_jobs_dequeued_total Jobs claimed from each lane", "# TYPE pbn_jobs_dequeued_total counter"]
+    lines += [f'pbn_jobs_dequeued_total{{lane="{lane}"}} {stats[lane]["dequeued"]}' for lane in LANES]
+    lines += ["# HELP pbn_jobs_in_flight Jobs claimed by a worker and not yet finished",
+              "# TYPE pbn_jobs_in_flight gauge", f"pbn_jobs_in_flight {stats['inProgress']}"]
+
+    pipe = queue.redis.pipeline(transaction=False)
+    for histogram in HISTOGRAMS:
+        pipe.hgetall(histogram.key)
+    for histogram, fields in zip(HISTOGRAMS, pipe.execute()):
+        lines += histogram.exposition(fields)
+    return "\n".join(lines) + "\n"
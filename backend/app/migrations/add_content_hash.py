@@ -0,0 +1,24 @@
+from sqlalchemy import create_engine, text
+
+def migrate():
+    # Use synchronous SQLite URL
+    engine = create_engine("sqlite:///uploads.db")
+    
+    with engine.connect() as conn:
+        # Add content_hash column if it doesn't exist
+        try:
+            conn.execute(text("""
+                ALTER TABLE uploads 
+                ADD COLUMN content_hash TEXT;
+            """))
+        except Exception as e:
+            print("Column might already exist:", e)
+        
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_uploads_content_hash ON uploads (content_hash);
+        """))
+        
+        conn.commit()
+
+if __name__ == "__main__":
+    migrate()
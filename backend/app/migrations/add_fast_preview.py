@@ -0,0 +1,17 @@
+from sqlalchemy import create_engine, text
+
+def migrate():
+    # Use synchronous SQLite URL
+    engine = create_engine("sqlite:///uploads.db")
+    
+    with engine.connect() as conn:
+        # Add fast_preview_filename column if it doesn't exist
+        try:
+            conn.execute(text("ALTER TABLE uploads ADD COLUMN fast_preview_filename TEXT;"))
+        except Exception as e:
+            print("Column might already exist:", e)
+        
+        conn.commit()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,20 @@
+from sqlalchemy import create_engine, text
+
+def migrate():
+    # Use synchronous SQLite URL
+    engine = create_engine("sqlite:///uploads.db")
+    
+    with engine.connect() as conn:
+        # WAL mode is persistent, so it only needs to be set once per database file
+        conn.execute(text("PRAGMA journal_mode=WAL;"))
+        
+        # Indexes for status filtering and keyset pagination of the uploads list
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_uploads_uploaded_at ON uploads (uploaded_at);"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_uploads_status ON uploads (status);"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_uploads_uploaded_at_id ON uploads (uploaded_at, id);"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_uploads_status_uploaded_at_id ON uploads (status, uploaded_at, id);"))
+        
+        conn.commit()
+
+if __name__ == "__main__":
+    migrate()
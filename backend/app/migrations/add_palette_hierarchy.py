@@ -0,0 +1,18 @@
+from sqlalchemy import create_engine, text
+
+def migrate():
+    # Use synchronous SQLite URL
+    engine = create_engine("sqlite:///uploads.db")
+    
+    with engine.connect() as conn:
+        # Add palette hierarchy columns if they don't exist
+        for column in ["palette_filename TEXT", "source_id TEXT"]:
+            try:
+                conn.execute(text(f"ALTER TABLE uploads ADD COLUMN {column};"))
+            except Exception as e:
+                print("Column might already exist:", e)
+        
+        conn.commit()
+
+if __name__ == "__main__":
+    migrate()
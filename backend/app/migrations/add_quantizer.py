@@ -0,0 +1,20 @@
+from sqlalchemy import create_engine, text
+
+def migrate():
+    # Use synchronous SQLite URL
+    engine = create_engine("sqlite:///uploads.db")
+    
+    with engine.connect() as conn:
+        # Add quantizer column if it doesn't exist
+        try:
+            conn.execute(text("""
+                ALTER TABLE uploads 
+                ADD COLUMN quantizer TEXT;
+            """))
+        except Exception as e:
+            print("Column might already exist:", e)
+        
+        conn.commit()
+
+if __name__ == "__main__":
+    migrate()
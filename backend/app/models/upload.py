@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Enum, Integer, CheckConstraint
+from sqlalchemy import Column, String, DateTime, Enum, Integer, JSON, CheckConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -18,18 +18,31 @@ class Upload(Base):
     id = Column(String, primary_key=True)
     filename = Column(String, nullable=False)
     original_name = Column(String, nullable=False)
-    uploaded_at = Column(DateTime, default=datetime.utcnow)
-    status = Column(Enum(ProcessingStatus), default=ProcessingStatus.PENDING)
+    content_hash = Column(String, nullable=True, index=True)  # SHA-256 of the uploaded file
+    uploaded_at = Column(DateTime, default=datetime.utcnow, index=True)
+    status = Column(Enum(ProcessingStatus), default=ProcessingStatus.PENDING, index=True)
     processed_filename = Column(String, nullable=True)
     filled_filename = Column(String, nullable=True)
+    preview_filename = Column(String, nullable=True)  # Downscaled outline for the UI
+    filled_preview_filename = Column(String, nullable=True)  # Downscaled color reference
+    thumbnail_filename = Column(String, nullable=True)
+    fast_preview_filename = Column(String, nullable=True)  # Low-resolution result shown before the full render
     error_message = Column(String, nullable=True)
     color_count = Column(Integer, nullable=False, default=20)
+    quantizer = Column(String, nullable=True)  # None uses the configured default
+    vector_format = Column(String, nullable=True)  # "svg" or "pdf" instead of raster outputs
+    palette_filename = Column(String, nullable=True)  # Cached palette hierarchy artifact
+    source_id = Column(String, nullable=True)  # Upload this one was re-rendered from
+    metrics = Column(JSON, nullable=True)  # Stage timings and peak RSS, queue wait, input/output sizes
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Add constraint to ensure color_count is between 2 and 30
     __table_args__ = (
         CheckConstraint('color_count >= 2 AND color_count <= 30', name='check_color_count'),
+        # Keyset pagination of the uploads list, optionally filtered by status
+        Index('ix_uploads_uploaded_at_id', 'uploaded_at', 'id'),
+        Index('ix_uploads_status_uploaded_at_id', 'status', 'uploaded_at', 'id'),
     )
 
     def to_dict(self):
@@ -41,8 +54,16 @@ class Upload(Base):
             "status": self.status.value,
             "processedFilename": self.processed_filename,
             "filledFilename": self.filled_filename,
+            "previewFilename": self.preview_filename,
+            "filledPreviewFilename": self.filled_preview_filename,
+            "thumbnailFilename": self.thumbnail_filename,
+            "fastPreviewFilename": self.fast_preview_filename,
             "errorMessage": self.error_message,
             "colorCount": self.color_count,
+            "quantizer": self.quantizer,
+            "vectorFormat": self.vector_format,
+            "sourceId": self.source_id,
+            "metrics": self.metrics,
             "createdAt": self.created_at.isoformat() if self.created_at else None,
             "updatedAt": self.updated_at.isoformat() if self.updated_at else None
         } 
\ No newline at end of file
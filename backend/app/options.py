@@ -0,0 +1,8 @@
+# Job options the API validates. They live apart from the modules that
+# implement them so the API process never imports the image stack.
+
+# Color quantization engines (implemented in quantize.QUANTIZERS)
+QUANTIZERS = ("kmeans", "minibatch", "histogram", "median_cut")
+
+# Vector formats create_paint_by_numbers can emit instead of raster images
+VECTOR_FORMATS = ("svg", "pdf")
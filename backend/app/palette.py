@@ -0,0 +1,117 @@
+import numpy as np
+from dataclasses import dataclass
+
+# Allowed range of color counts, matching the upload form and the database constraint
+MIN_COLORS = 2
+MAX_COLORS = 30
+
+
+@dataclass
+class PaletteHierarchy:
+    """A fine quantization plus the merges that reduce it to any color count
+
+    assignments[k] maps every fine color to its cluster when the palette is
+    reduced to k colors, so a label map for any k in MIN_COLORS..MAX_COLORS is
+    a single lookup into fine_labels.
+    """
+    fine_labels: np.ndarray  # (h, w) uint8 fine color index per pixel at processing resolution
+    fine_colors: np.ndarray  # (n, 3) uint8 RGB fine palette
+    counts: np.ndarray  # (n,) pixels per fine color
+    assignments: np.ndarray  # (MAX_COLORS + 1, n) uint8 cluster of each fine color per k
+    work_shape: tuple  # (height, width) of the blurred working image
+    original_shape: tuple  # (height, width) of the decoded input
+
+    @property
+    def n_fine(self):
+        return len(self.fine_colors)
+
+    def palette(self, n_colors):
+        """Label map and RGB palette for n_colors (capped at the fine palette size)"""
+        n_colors = min(max(n_colors, MIN_COLORS), self.n_fine)
+        assignment = self.assignments[n_colors]
+
+        # Merged colors are the pixel-weighted mean of their fine colors
+        weights = np.bincount(assignment, weights=self.counts, minlength=n_colors)
+        sums = np.stack([np.bincount(assignment, weights=self.counts * self.fine_colors[:, c],
+                                     minlength=n_colors) for c in range(3)], axis=1)
+        colors = np.uint8(np.round(sums / np.maximum(weights, 1)[:, None]))
+        return assignment[self.fine_labels], colors
+
+    def to_arrays(self):
+        """Named arrays for storing the hierarchy as an .npz artifact"""
+        return {
+            "fine_labels": self.fine_labels,
+            "fine_colors": self.fine_colors,
+            "counts": self.counts,
+            "assignments": self.assignments,
+            "work_shape": np.array(self.work_shape),
+            "original_shape": np.array(self.original_shape),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(
+            fine_labels=arrays["fine_labels"],
+            fine_colors=arrays["fine_colors"],
+            counts=arrays["counts"],
+            assignments=arrays["assignments"],
+            work_shape=tuple(int(v) for v in arrays["work_shape"]),
+            original_shape=tuple(int(v) for v in arrays["original_shape"]),
+        )
+
+
+def agglomerate_palette(colors, counts):
+    """Greedily merge fine colors with Ward's criterion down to MIN_COLORS
+
+    Returns a (MAX_COLORS + 1, n) table whose row k assigns every fine color
+    to one of k clusters. Rows above the fine palette size repeat the
+    identity assignment.
+    """
+    n = len(colors)
+    assignments = np.zeros((MAX_COLORS + 1, n), dtype=np.uint8)
+
+    means = colors.astype(np.float64)
+    weights = counts.astype(np.float64)
+    members = [[i] for i in range(n)]
+    active = list(range(n))
+
+    for k in range(n, MIN_COLORS - 1, -1):
+        if k <= MAX_COLORS:
+            for cluster, idx in enumerate(active):
+                assignments[k, members[idx]] = cluster
+        if k == MIN_COLORS:
+            break
+
+        # Merge the pair with the smallest increase in within-cluster variance
+        m = means[active]
+        w = weights[active]
+        distances = ((m[:, None, :] - m[None, :, :]) ** 2).sum(axis=2)
+        cost = distances * (w[:, None] * w[None, :]) / np.maximum(w[:, None] + w[None, :], 1)
+        np.fill_diagonal(cost, np.inf)
+        a, b = np.unravel_index(np.argmin(cost), cost.shape)
+        keep, drop = active[min(a, b)], active[max(a, b)]
+
+        total = weights[keep] + weights[drop]
+        if total > 0:
+            means[keep] = (means[keep] * weights[keep] + means[drop] * weights[drop]) / total
+        weights[keep] = total
+        members[keep].extend(members[drop])
+        active.remove(drop)
+
+    # Color counts beyond the fine palette size fall back to the full fine palette
+    for k in range(n + 1, MAX_COLORS + 1):
+        assignments[k] = np.arange(n)
+    return assignments
+
+
+def build_palette_hierarchy(fine_labels, fine_colors, work_shape, original_shape):
+    """Build the hierarchy for a fine quantization of the working image"""
+    counts = np.bincount(fine_labels.ravel(), minlength=len(fine_colors))
+    return PaletteHierarchy(
+        fine_labels=fine_labels.astype(np.uint8),
+        fine_colors=fine_colors.astype(np.uint8),
+        counts=counts,
+        assignments=agglomerate_palette(fine_colors, counts),
+        work_shape=tuple(work_shape),
+        original_shape=tuple(original_shape),
+    )
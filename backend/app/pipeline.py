@@ -0,0 +1,114 @@
+import logging
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    """One named step of a pipeline
+
+    func takes the stage's input artifacts followed by its parameters as
+    keyword arguments and returns a dict with every declared output. A
+    persisted stage stores its outputs in the artifact cache under the
+    content hash and the parameters it (transitively) depends on; dump and
+    load convert outputs to and from named arrays when they are not arrays
+    already. Durable stages are stored outside the cache's eviction.
+    """
+    name: str
+    func: Callable
+    inputs: tuple
+    outputs: tuple
+    params: tuple = ()
+    persist: bool = False
+    compress: bool = False
+    durable: bool = False
+    progress: Optional[str] = None  # Progress event published when the stage runs
+    dump: Optional[Callable] = None
+    load: Optional[Callable] = None
+
+
+@dataclass
+class Pipeline:
+    """A set of stages wired together by the artifact names they consume and produce"""
+    stages: list
+    producers: dict = field(init=False)
+
+    def __post_init__(self):
+        self.producers = {}
+        for stage in self.stages:
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError(f"Artifact {output} is produced by both {self.producers[output].name} and {stage.name}")
+                self.producers[output] = stage
+
+    def stage(self, name):
+        return next(stage for stage in self.stages if stage.name == name)
+
+    def key_params(self, stage):
+        """Names of every parameter a stage's outputs depend on, its own and its upstream stages'"""
+        names = set(stage.params)
+        for artifact in stage.inputs:
+            if artifact in self.producers:
+                names |= self.key_params(self.producers[artifact])
+        return names
+
+    def artifact_key(self, cache, content_hash, stage_name, params):
+        """Cache key of a persisted stage's outputs for a content hash and parameter set"""
+        stage = self.stage(stage_name)
+        return cache.key(content_hash, stage.name, **{name: params[name] for name in self.key_params(stage)})
+
+    def run(self, targets, inputs, params, cache=None, content_hash=None, on_stage=None, monitor=None):
+        """Produce the target artifacts, running only the stages they need
+
+        Stages are resolved backwards from the targets: an artifact already
+        given in inputs or found in the cache stops the walk, so stages
+        whose outputs are unused, or already persisted, never run. monitor,
+        when given, is called with each stage name and returns a context
+        manager wrapped around that stage's function (for timing and memory
+        measurements). Returns every artifact produced or loaded along the way.
+        """
+        artifacts = dict(inputs)
+        published = set()
+
+        def report(progress):
+            # Several stages may share one progress event; publish it once
+            if on_stage and progress not in published:
+                published.add(progress)
+                on_stage(progress)
+
+        for target in targets:
+            self.resolve(target, artifacts, params, cache, content_hash, report, monitor)
+        return artifacts
+
+    def resolve(self, artifact, artifacts, params, cache, content_hash, on_stage, monitor=None):
+        if artifact in artifacts:
+            return
+        if artifact not in self.producers:
+            raise ValueError(f"No stage produces {artifact} and it was not given as an input")
+        stage = self.producers[artifact]
+
+        # Resume from a persisted copy of this stage's outputs when there is one
+        key = None
+        if stage.persist and cache is not None and content_hash:
+            key = self.artifact_key(cache, content_hash, stage.name, params)
+            stored = cache.get(key, durable=stage.durable)
+            if stored is not None:
+                artifacts.update(stage.load(stored) if stage.load else stored)
+                return
+
+        for name in stage.inputs:
+            self.resolve(name, artifacts, params, cache, content_hash, on_stage, monitor)
+        if stage.progress:
+            on_stage(stage.progress)
+        logger.debug(f"Running stage {stage.name}")
+        with monitor(stage.name) if monitor else nullcontext():
+            outputs = stage.func(*(artifacts[name] for name in stage.inputs),
+                                 **{name: params[name] for name in stage.params})
+        artifacts.update(outputs)
+
+        if key is not None:
+            stored = stage.dump(outputs) if stage.dump else outputs
+            cache.put(key, compress=stage.compress, durable=stage.durable, **stored)
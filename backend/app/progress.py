@@ -0,0 +1,48 @@
+import json
+import logging
+import os
+import time
+import redis
+from .core import config
+
+logger = logging.getLogger(__name__)
+
+# Stages reported while a job runs; done and failed are terminal
+STAGES = ("preview", "decoding", "quantizing", "rendering", "encoding", "done", "failed")
+TERMINAL_STAGES = ("done", "failed")
+
+# How long the latest event is kept for clients that subscribe mid-job
+LAST_EVENT_TTL = 3600
+
+_client = None
+_client_pid = None
+
+
+def progress_channel(upload_id: str) -> str:
+    return f"upload_progress:{upload_id}"
+
+
+def last_event_key(upload_id: str) -> str:
+    return f"upload_progress_last:{upload_id}"
+
+
+def get_client():
+    """Redis client shared by this process, recreated after a fork"""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = redis.Redis.from_url(config.REDIS_URL, decode_responses=True)
+        _client_pid = os.getpid()
+    return _client
+
+
+def publish_progress(upload_id: str, stage: str, **fields):
+    """Publish a stage event for an upload; failures are logged and never raised"""
+    event = {"id": upload_id, "stage": stage, "timestamp": time.time(), **fields}
+    payload = json.dumps(event)
+    try:
+        pipe = get_client().pipeline()
+        pipe.set(last_event_key(upload_id), payload, ex=LAST_EVENT_TTL)
+        pipe.publish(progress_channel(upload_id), payload)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not publish progress for {upload_id}: {e}")
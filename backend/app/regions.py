@@ -0,0 +1,314 @@
+import cv2
+import numpy as np
+from dataclasses import dataclass
+from scipy import ndimage
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from .core import config
+from .threads import parallel_map
+from .tiling import iter_bands
+
+# Peak bytes per pixel of labeling one band, measured as RSS growth (about
+# 16: region ids, one color's labels and mask, the color offset lookup and
+# OpenCV's own buffers), plus the shifted copy written into the full map
+LABEL_BYTES_PER_PIXEL = 20
+
+# mode_filter votes over this many blocks of rows in turn; each voting pixel
+# holds about 200 bytes of neighbor and count buffers, so this bounds the vote
+# to a few bytes per pixel of the map
+MODE_VOTE_BLOCKS = 64
+
+
+@dataclass
+class Region:
+    """A connected area of a single palette color"""
+    id: int
+    color: int
+    area: int
+    bbox: tuple  # (x, y, width, height) in label map pixels
+    centroid: tuple  # (x, y) in label map pixels
+    contour: np.ndarray  # Outer boundary in label map pixels
+
+
+@dataclass
+class RegionTable:
+    """All regions of a label map, built once and shared by every render step"""
+    components: np.ndarray  # Region id per pixel
+    regions: list  # Regions of at least the minimum area, ordered by id
+    shape: tuple  # (height, width) of the label map
+
+    def kept_ids(self):
+        """Boolean lookup table of kept regions, indexed by region id"""
+        keep = np.zeros(int(self.components.max()) + 1, dtype=bool)
+        keep[[region.id for region in self.regions]] = True
+        return keep
+
+    def keep_mask(self):
+        """Boolean mask of the pixels covered by the kept regions"""
+        return self.kept_ids()[self.components]
+
+
+def mode_filter(labels):
+    """3x3 majority filter for a compact (uint8) label map; ties keep the center label
+
+    Only pixels whose neighborhood holds more than one label can change, so
+    the vote runs on just those pixels: their nine neighbors are gathered and
+    compared pairwise to count how often each value occurs. The vote runs
+    block by block (see MODE_VOTE_BLOCKS), so its buffers stay a small
+    fraction of the map however noisy it is.
+    """
+    kernel = np.ones((3, 3), dtype=np.uint8)
+    lowest = cv2.erode(labels, kernel, borderType=cv2.BORDER_REFLECT_101)
+    highest = cv2.dilate(labels, kernel, borderType=cv2.BORDER_REFLECT_101)
+    changing = cv2.compare(lowest, highest, cv2.CMP_NE)
+    del lowest, highest
+    smoothed = labels.copy()
+    if not cv2.countNonZero(changing):
+        return smoothed
+
+    padded = cv2.copyMakeBorder(labels, 1, 1, 1, 1, cv2.BORDER_REFLECT_101)
+    h = labels.shape[0]
+    for top, bottom, _, _ in iter_bands(h, -(-h // MODE_VOTE_BLOCKS)):
+        ys, xs = np.nonzero(changing[top:bottom])
+        if len(ys) == 0:
+            continue
+        ys += top
+        neighbors = np.stack([padded[ys + dy, xs + dx] for dy in range(3) for dx in range(3)], axis=1)
+        counts = (neighbors[:, :, None] == neighbors[:, None, :]).sum(axis=2, dtype=np.uint8)
+        # Index 4 is the center pixel
+        winner = np.where(counts[:, 4] == counts.max(axis=1), 4, counts.argmax(axis=1))
+        smoothed[ys, xs] = neighbors[np.arange(len(ys)), winner]
+    return smoothed
+
+
+def label_band(segments):
+    """Label 4-connected areas of equal palette index in a (uint8) label map
+
+    Each palette index is labeled with one raster connected-components pass
+    over its mask. Labels are accumulated as they come, and every pixel's
+    color offset is added in a single lookup at the end.
+    """
+    components = np.zeros(segments.shape, dtype=np.int32)
+    n_labels = int(segments.max()) + 1
+    offsets = np.zeros(n_labels, dtype=np.int32)
+    n_components = 0
+    for label in range(n_labels):
+        mask = cv2.compare(segments, label, cv2.CMP_EQ)
+        n, band = cv2.connectedComponents(mask, connectivity=4, ltype=cv2.CV_32S)
+        if n > 1:
+            cv2.add(components, band, dst=components)
+        # Component labels start at 1; shift them to follow the previous colors'
+        offsets[label] = n_components - 1
+        n_components += n - 1
+    components += offsets[segments]
+    return components, n_components
+
+
+def label_connected_regions(segments, rows=None):
+    """Label 4-connected areas of equal palette index
+
+    With rows set, the map is labeled in horizontal bands of that many rows
+    and components touching across band seams are joined afterwards, which
+    bounds the labeling buffers. Both paths find the same regions; only
+    their ids may be numbered differently.
+    """
+    h, w = segments.shape
+    if not rows or rows >= h:
+        return label_band(segments)
+
+    components = np.empty((h, w), dtype=np.int32)
+    n_band_components = 0
+    for top, bottom, _, _ in iter_bands(h, rows):
+        band, n = label_band(segments[top:bottom])
+        components[top:bottom] = band + n_band_components
+        n_band_components += n
+
+    # Join band components that share a color across each seam
+    seams = np.arange(rows, h, rows)
+    same = segments[seams - 1] == segments[seams]
+    above = components[seams - 1][same]
+    below = components[seams][same]
+    graph = coo_matrix((np.ones(len(above), dtype=np.int8), (above, below)),
+                       shape=(n_band_components, n_band_components))
+    n_components, merged = connected_components(graph, directed=False)
+    merged = merged.astype(np.int32)
+    for top, bottom, _, _ in iter_bands(h, rows):
+        components[top:bottom] = merged[components[top:bottom]]
+    return components, n_components
+
+
+def region_adjacency(components, n_components):
+    """Touching region pairs (a < b) with the length of their shared boundary in pixel edges"""
+    firsts, seconds = [], []
+    for first, second in ((components[:, :-1], components[:, 1:]), (components[:-1, :], components[1:, :])):
+        differ = first != second
+        firsts.append(first[differ])
+        seconds.append(second[differ])
+    first = np.concatenate(firsts).astype(np.int64)
+    second = np.concatenate(seconds).astype(np.int64)
+    keys, lengths = np.unique(np.minimum(first, second) * n_components + np.maximum(first, second),
+                              return_counts=True)
+    return keys // n_components, keys % n_components, lengths
+
+
+def merge_small_regions(segments, palette, min_area, rows=None):
+    """Recolor regions smaller than min_area into their most similar neighbor
+
+    Regions and their adjacency graph are built once from the label map.
+    Each round, every undersized region picks the neighbor whose palette
+    color is closest (ties go to the longest shared boundary). All picks are
+    merged at once as a batched union-find over the graph, and the round
+    repeats until no undersized region with a neighbor is left. A merged
+    group keeps the color of its largest member. Returns the recolored label
+    map and its region id per pixel, so the map need not be labeled again;
+    rows bounds the band height used for labeling.
+    """
+    components, n_components = label_connected_regions(segments, rows=rows)
+    flat = components.ravel()
+    areas = np.bincount(flat, minlength=n_components)
+    if n_components < 2 or areas.min() >= min_area:
+        return segments, components
+
+    colors = np.zeros(n_components, dtype=np.int64)
+    colors[flat] = segments.ravel()
+    first, second, lengths = region_adjacency(components, n_components)
+    palette = np.asarray(palette, dtype=np.float64)
+    group_of = np.arange(n_components)
+
+    while True:
+        # Every edge from an undersized group, in both directions
+        source = np.concatenate([first, second])
+        target = np.concatenate([second, first])
+        shared = np.concatenate([lengths, lengths])
+        small = areas[source] < min_area
+        source, target, shared = source[small], target[small], shared[small]
+        if len(source) == 0:
+            break
+
+        # Closest color first, then longest boundary; keep each group's best edge
+        distance = ((palette[colors[source]] - palette[colors[target]]) ** 2).sum(axis=1)
+        order = np.lexsort((-shared, distance, source))
+        _, best = np.unique(source[order], return_index=True)
+        source, target = source[order[best]], target[order[best]]
+
+        # Union the picked pairs; connected components resolve chains and cycles
+        n_groups = len(areas)
+        graph = coo_matrix((np.ones(len(source), dtype=np.int8), (source, target)), shape=(n_groups, n_groups))
+        n_merged, merged = connected_components(graph, directed=False)
+
+        # Largest member's color wins; areas add up
+        largest = np.lexsort((-areas, merged))
+        _, leaders = np.unique(merged[largest], return_index=True)
+        colors = colors[largest[leaders]]
+        areas = np.bincount(merged, weights=areas, minlength=n_merged).astype(np.int64)
+        group_of = merged[group_of]
+
+        # Carry the adjacency graph over to the merged groups
+        first, second = merged[first], merged[second]
+        between = first != second
+        keys, inverse = np.unique(np.minimum(first, second)[between] * n_merged
+                                  + np.maximum(first, second)[between], return_inverse=True)
+        lengths = np.bincount(inverse, weights=lengths[between]).astype(np.int64)
+        first, second = keys // n_merged, keys % n_merged
+
+    # Touching groups that ended up with the same color form one region
+    n_groups = len(areas)
+    same = colors[first] == colors[second]
+    graph = coo_matrix((np.ones(int(same.sum()), dtype=np.int8), (first[same], second[same])),
+                       shape=(n_groups, n_groups))
+    _, region_of = connected_components(graph, directed=False)
+
+    # One lookup per pixel from original region to its group's color and final region
+    lookup = colors[group_of].astype(segments.dtype)
+    return lookup[components], region_of[group_of].astype(np.int32)[components]
+
+
+def build_region_table(segments, min_area, rows=None, components=None):
+    """Build the region table (id, color, area, bbox, centroid, contour) for a label map
+
+    components, when the caller already has them (see merge_small_regions),
+    are the map's region ids; otherwise the map is labeled here, rows
+    bounding the band height (see label_connected_regions).
+    """
+    h, w = segments.shape
+    if components is None:
+        components, n_components = label_connected_regions(segments, rows=rows)
+    else:
+        n_components = int(components.max()) + 1
+    flat = components.ravel()
+
+    # Per-region statistics, all computed in bulk
+    areas = np.bincount(flat, minlength=n_components)
+    colors = np.zeros(n_components, dtype=np.int32)
+    colors[flat] = segments.ravel()
+    slices = ndimage.find_objects(components + 1)
+
+    def extract(region_ids):
+        regions = []
+        for region_id in region_ids:
+            rows, cols = slices[region_id]
+            x, y = cols.start, rows.start
+            mask = (components[rows, cols] == region_id).astype(np.uint8)
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x, y))
+            # Centroid from the cropped mask's moments, so no full-size coordinate grids are needed
+            moments = cv2.moments(mask, binaryImage=True)
+            regions.append(Region(
+                id=int(region_id),
+                color=int(colors[region_id]),
+                area=int(areas[region_id]),
+                bbox=(x, y, cols.stop - x, rows.stop - y),
+                centroid=(x + moments["m10"] / moments["m00"], y + moments["m01"] / moments["m00"]),
+                contour=max(contours, key=len),
+            ))
+        return regions
+
+    # Regions are independent, so chunks of them are traced on the job's threads
+    kept = np.flatnonzero(areas >= min_area)
+    chunks = np.array_split(kept, min(len(kept), 4 * config.WORKER_THREADS) or 1)
+    regions = [region for chunk in parallel_map(extract, chunks) for region in chunk]
+
+    return RegionTable(components=components, regions=regions, shape=(h, w))
+
+
+def scale_contours(regions, scale):
+    """Scale region contours from label map pixels to an output canvas"""
+    # Map pixel centers so boundaries stay centered on the upscaled pixel blocks
+    return [np.round((region.contour + 0.5) * scale - 0.5).astype(np.int32) for region in regions]
+
+
+def label_points(table):
+    """Most interior point of every kept region, as an (n, 2) array of (x, y) label map pixels
+
+    One distance transform of the region boundaries gives each pixel's
+    distance to the nearest edge; the per-region maximum is found in bulk,
+    so the point always lies inside the region, even for concave shapes.
+    """
+    components = table.components
+    if not table.regions:
+        return np.empty((0, 2), dtype=np.int64)
+
+    # Boundary pixels (and the image border) are the zeros of the transform
+    interior = np.ones(components.shape, dtype=np.uint8)
+    horizontal = components[:, :-1] != components[:, 1:]
+    vertical = components[:-1, :] != components[1:, :]
+    interior[:, :-1][horizontal] = 0
+    interior[:, 1:][horizontal] = 0
+    interior[:-1, :][vertical] = 0
+    interior[1:, :][vertical] = 0
+    interior[[0, -1], :] = 0
+    interior[:, [0, -1]] = 0
+    distance = cv2.distanceTransform(interior, cv2.DIST_L2, 5)
+
+    # Per-region maximum distance, then the first pixel (in raster order) reaching it
+    flat_components = components.ravel()
+    flat_distance = distance.ravel()
+    deepest = np.zeros(int(flat_components.max()) + 1, dtype=np.float32)
+    np.maximum.at(deepest, flat_components, flat_distance)
+    candidates = np.flatnonzero(flat_distance == deepest[flat_components])
+    region_ids, first = np.unique(flat_components[candidates], return_index=True)
+    best = np.zeros(len(deepest), dtype=np.int64)
+    best[region_ids] = candidates[first]
+
+    positions = best[[region.id for region in table.regions]]
+    ys, xs = np.divmod(positions, components.shape[1])
+    return np.stack([xs, ys], axis=1)
@@ -0,0 +1,235 @@
+import cv2
+import numpy as np
+from functools import lru_cache
+from .regions import label_points, scale_contours
+from .threads import parallel_map
+from .tiling import iter_bands
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def final_dimensions(original_w, original_h):
+    """Calculate output dimensions, never below 4K width, maintaining aspect ratio"""
+    # For high resolution output, target 4K width if the original is larger
+    target_width = min(3840, max(2048, original_w))  # Never go below 2K, cap at 4K
+    final_scale = target_width / original_w
+    final_width = int(target_width)
+    final_height = int(original_h * final_scale)
+
+    # Ensure minimum size for visibility
+    final_width = max(3840, final_width)
+    final_height = max(int(3840 * (original_h / original_w)), final_height)
+    return final_width, final_height
+
+
+def output_palette(unique_colors):
+    """BGR palette of the rendered outputs: the colors, then black lines and white boxes
+
+    Outputs are drawn as indices into this palette (see render_indexed).
+    """
+    return np.vstack([unique_colors[:, ::-1], [[0, 0, 0], [255, 255, 255]]]).astype(np.uint8)
+
+
+def line_indices(unique_colors):
+    """Palette indices of black and white in output_palette
+
+    They are adjacent, so text that OpenCV anti-aliases between them still
+    lands on one of the two.
+    """
+    return len(unique_colors), len(unique_colors) + 1
+
+
+def indexed_to_bgr(indices, palette):
+    """Expand a palette index image into a BGR image with one table lookup per pixel"""
+    lookup = np.zeros((256, 1, 3), dtype=np.uint8)
+    lookup[:len(palette), 0] = palette
+    return cv2.LUT(cv2.merge([indices, indices, indices]), lookup)
+
+
+def create_canvas(final_width, final_height, palette_height, fill):
+    """Allocate an index canvas of one palette index with room for the palette strip below the image"""
+    canvas = np.empty((final_height + palette_height, final_width), dtype=np.uint8)
+    canvas.fill(fill)
+    return canvas
+
+
+def create_filled_version(segments_smoothed, unique_colors, regions, image, rows=None):
+    """Fill the kept regions of an index canvas view with their palette index
+
+    With rows set, the canvas is filled in bands of that many output rows,
+    sampling the label map directly instead of upscaling it whole.
+    """
+    final_height, final_width = image.shape[:2]
+    _, white = line_indices(unique_colors)
+
+    # Pixels of skipped regions stay white
+    if not rows or rows >= final_height:
+        indexed = np.where(regions.keep_mask(), segments_smoothed, white).astype(np.uint8)
+        image[:] = cv2.resize(indexed, (final_width, final_height), interpolation=cv2.INTER_NEAREST)
+        return image
+
+    # Nearest-neighbour source row and column of every output pixel
+    h, w = segments_smoothed.shape
+    source_rows = np.arange(final_height) * h // final_height
+    source_cols = np.arange(final_width) * w // final_width
+    kept = regions.kept_ids()
+    for top, bottom, _, _ in iter_bands(final_height, rows):
+        band_rows = source_rows[top:bottom]
+        components = regions.components[band_rows][:, source_cols]
+        image[top:bottom] = np.where(kept[components], segments_smoothed[band_rows][:, source_cols], white)
+    return image
+
+
+def number_style(final_width):
+    """Font scale, stroke thickness and box padding of region numbers at an output width"""
+    # Calculate font scale based on final resolution
+    base_font_scale = 0.4  # Increased base size
+    font_scale = max(base_font_scale, (final_width / 2048) * base_font_scale)
+    thickness = max(1, int(final_width / 1024))  # Thicker font for visibility
+
+    # Increased padding for better visibility
+    padding = max(2, int(final_width / 512))
+    return font_scale, thickness, padding
+
+
+@lru_cache(maxsize=1024)
+def number_stamp(number, font_scale, thickness, padding, black, white):
+    """A region number on its white box, rendered once per (number, style, palette indices)
+
+    Returns the index stamp, the mask of pixels it covers and the offset of
+    the number's center within it.
+    """
+    (text_width, text_height), baseline = cv2.getTextSize(number, FONT, font_scale, thickness)
+    # Leave room for strokes that extend past the measured text box
+    margin = thickness + baseline
+    center_x = text_width // 2 + padding + margin
+    center_y = text_height // 2 + padding + margin
+    size = (2 * center_y + 1, 2 * center_x + 1)
+
+    stamp = np.zeros(size, dtype=np.uint8)
+    mask = np.zeros(size, dtype=np.uint8)
+    box = ((center_x - text_width//2 - padding, center_y - text_height//2 - padding),
+           (center_x + text_width//2 + padding, center_y + text_height//2 + padding))
+    origin = (center_x - text_width//2, center_y + text_height//2)
+    cv2.rectangle(stamp, *box, white, -1)
+    cv2.rectangle(mask, *box, 255, -1)
+    cv2.putText(stamp, number, origin, FONT, font_scale, black, thickness)
+    cv2.putText(mask, number, origin, FONT, font_scale, 255, thickness)
+    return stamp, mask > 0, (center_x, center_y)
+
+
+def paste_stamp(image, stamp, mask, left, top):
+    """Copy the masked pixels of a stamp onto an image at (left, top), clipped to its bounds"""
+    height, width = image.shape[:2]
+    x0, y0 = max(left, 0), max(top, 0)
+    x1, y1 = min(left + mask.shape[1], width), min(top + mask.shape[0], height)
+    if x0 >= x1 or y0 >= y1:
+        return
+    window = (slice(y0 - top, y1 - top), slice(x0 - left, x1 - left))
+    image[y0:y1, x0:x1][mask[window]] = stamp[window][mask[window]]
+
+
+def draw_numbers(images, regions, points, scale, final_width, black, white):
+    """Stamp each region's palette number on a white box at its label point
+
+    points are the regions' label points in label map pixels (see
+    regions.label_points); black and white are the palette indices to draw
+    with. Each distinct number is rendered once and then copied into place,
+    so the per-region cost is a single array copy.
+    """
+    font_scale, thickness, padding = number_style(final_width)
+
+    # Label points are pixel centers; map them onto the scaled canvas
+    centers = np.floor((points + 0.5) * scale).astype(np.int64)
+    for region, (cX, cY) in zip(regions, centers.tolist()):
+        stamp, mask, (offset_x, offset_y) = number_stamp(str(region.color + 1), font_scale, thickness, padding,
+                                                              black, white)
+        # Add numbers to every version with white background
+        for target_image in images:
+            paste_stamp(target_image, stamp, mask, cX - offset_x, cY - offset_y)
+
+
+def draw_palette(palette, unique_colors):
+    """Draw the numbered color reference strip into an index canvas view"""
+    palette_height, final_width = palette.shape[:2]
+    black, white = line_indices(unique_colors)
+
+    # Calculate width for each color in palette
+    n_unique_colors = len(unique_colors)
+    color_width = final_width // n_unique_colors
+
+    # Draw palette with larger numbers
+    for i in range(n_unique_colors):
+        x1 = i * color_width
+        x2 = (i + 1) * color_width if i < n_unique_colors - 1 else final_width
+
+        # Draw color rectangle
+        cv2.rectangle(palette, (x1, 0), (x2, palette_height), i, -1)
+
+        # Add number with larger font
+        number = str(i + 1)
+        font_scale_palette = max(0.8, (final_width / 2048) * 1.5)  # Larger palette numbers
+        thickness = max(1, int(final_width / 1024))
+
+        (text_width, text_height), _ = cv2.getTextSize(number, FONT, font_scale_palette, thickness)
+        text_x = x1 + (x2 - x1)//2 - text_width//2
+        text_y = palette_height - max(20, int(palette_height / 3))
+
+        # Draw number with white background
+        padding = max(4, int(final_width / 512))
+        cv2.rectangle(palette,
+                      (text_x - padding, text_y - text_height - padding),
+                      (text_x + text_width + padding, text_y + padding),
+                      white, -1)
+        cv2.putText(palette, number, (text_x, text_y),
+                    FONT, font_scale_palette, black, thickness)
+
+
+def render_indexed(segments_smoothed, unique_colors, regions, final_width, final_height, rows=None):
+    """Render the outline and filled images at final resolution as output_palette indices
+
+    Region contours are scaled from the processing resolution and drawn once on
+    the final canvases. Every pixel is a palette color, black or white, so
+    the index images encode as indexed PNGs without matching colors again.
+    rows bounds the band height used to fill the color reference.
+    """
+    h, w = regions.shape
+    scale = final_width / w
+    black, white = line_indices(unique_colors)
+
+    # Create color palette reference at new size with larger height
+    palette_height = int(final_height * 0.08)  # Increased from 0.05 for better visibility
+    outline_final = create_canvas(final_width, final_height, palette_height, white)
+    filled_final = create_canvas(final_width, final_height, palette_height, white)
+    outline_image = outline_final[:final_height]
+    filled_image = filled_final[:final_height]
+
+    # Draw sharp contours scaled from the region table
+    contours = scale_contours(regions.regions, scale)
+    # Match the weight of a one pixel line at processing resolution
+    line_thickness = max(1, int(round(scale)))
+    points = label_points(regions)
+
+    def draw(target):
+        image, filled = target
+        # Create filled version with only valid regions
+        if filled:
+            create_filled_version(segments_smoothed, unique_colors, regions, image, rows=rows)
+        cv2.drawContours(image, contours, -1, black, line_thickness)
+        draw_numbers([image], regions.regions, points, scale, final_width, black, white)
+
+    # The two versions share nothing but read-only inputs, so they render side by side
+    parallel_map(draw, [(outline_image, False), (filled_image, True)])
+
+    # Draw the palette once and share it between both outputs
+    draw_palette(outline_final[final_height:], unique_colors)
+    filled_final[final_height:] = outline_final[final_height:]
+
+    return outline_final, filled_final
+
+
+def render_outputs(segments_smoothed, unique_colors, regions, final_width, final_height, rows=None):
+    """Render the outline and filled images at final resolution, in BGR order ready for encoding"""
+    palette = output_palette(unique_colors)
+    indexed = render_indexed(segments_smoothed, unique_colors, regions, final_width, final_height, rows=rows)
+    return tuple(indexed_to_bgr(indices, palette) for indices in indexed)
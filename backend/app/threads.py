@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import cv2
+from threadpoolctl import threadpool_limits
+from .core import config
+
+_executor = None
+
+
+def executor():
+    """Process-wide pool sized to the per-job thread budget, created on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=config.WORKER_THREADS, thread_name_prefix="job")
+    return _executor
+
+
+def parallel_map(func, items):
+    """map() on the job thread pool, or inline when the budget is a single thread
+
+    Meant for steps dominated by OpenCV/NumPy calls that release the GIL.
+    """
+    items = list(items)
+    if config.WORKER_THREADS <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    return list(executor().map(func, items))
+
+
+@contextmanager
+def job_threads(threads=None):
+    """Cap OpenCV's and the BLAS/OpenMP pools' thread counts for the duration of a job"""
+    threads = threads or config.WORKER_THREADS
+    previous = cv2.getNumThreads()
+    cv2.setNumThreads(threads)
+    try:
+        with threadpool_limits(limits=threads):
+            yield
+    finally:
+        cv2.setNumThreads(previous)
@@ -0,0 +1,50 @@
+import numpy as np
+from .core import config
+
+# Smallest band worth processing on its own
+MIN_BAND_ROWS = 64
+
+
+def memory_budget_bytes():
+    """Configured per-job memory budget in bytes, or None when tiling is disabled"""
+    return config.MEMORY_BUDGET_MB * 1024 * 1024 if config.MEMORY_BUDGET_MB > 0 else None
+
+
+def band_rows(height, width, bytes_per_pixel, overlap=0, budget=None):
+    """Rows per band so that one band's working buffers fit in the budget
+
+    bytes_per_pixel is the total size of all buffers a stage keeps per pixel
+    of a band. Without a budget the whole image is one band.
+    """
+    budget = budget if budget is not None else memory_budget_bytes()
+    if not budget:
+        return height
+    rows = budget // max(1, width * bytes_per_pixel) - 2 * overlap
+    return int(min(height, max(MIN_BAND_ROWS, rows)))
+
+
+def iter_bands(height, rows, overlap=0):
+    """Yield (top, bottom, padded_top, padded_bottom) row ranges covering height"""
+    for top in range(0, height, rows):
+        bottom = min(height, top + rows)
+        yield top, bottom, max(0, top - overlap), min(height, bottom + overlap)
+
+
+def map_bands(func, src, overlap, rows, dtype=None, channels=None):
+    """Apply a neighbourhood filter band by band
+
+    Each band is padded with overlap rows on both sides so pixels near the
+    band edges see the same neighbourhood as in a whole-image pass, as long
+    as overlap covers the filter radius. func must return an array with the
+    same number of rows as its input.
+    """
+    height = src.shape[0]
+    if rows >= height:
+        return func(src)
+
+    shape = src.shape if channels is None else src.shape[:2] + (channels,)
+    dst = np.empty(shape, dtype=dtype or src.dtype)
+    for top, bottom, padded_top, padded_bottom in iter_bands(height, rows, overlap):
+        out = func(src[padded_top:padded_bottom])
+        dst[top:bottom] = out[top - padded_top:bottom - padded_top]
+    return dst
@@ -0,0 +1,137 @@
+import io
+import cv2
+from .regions import label_points
+from .render import final_dimensions
+
+# Maximum distance in label map pixels a simplified path may stray from the contour
+SIMPLIFY_EPSILON = 0.75
+
+# Region and palette number sizes as fractions of the image width, matching
+# the raster output's text
+NUMBER_FONT_SIZE = 0.006
+PALETTE_FONT_SIZE = 0.022
+
+# Palette strip height as a fraction of the image height, as in the raster output
+PALETTE_HEIGHT = 0.08
+
+FONT_FAMILY = "Helvetica, Arial, sans-serif"
+
+
+def simplify_contours(regions, epsilon=SIMPLIFY_EPSILON):
+    """Douglas-Peucker simplified region contours, largest enclosing area first
+
+    Drawing in this order lets regions nested inside another region's outer
+    boundary paint over it, so holes need no separate subpaths.
+    """
+    simplified = [(cv2.contourArea(region.contour), region,
+                   cv2.approxPolyDP(region.contour, epsilon, True).reshape(-1, 2))
+                  for region in regions.regions]
+    simplified.sort(key=lambda item: -item[0])
+    return [(region, points) for _, region, points in simplified]
+
+
+def hex_color(color):
+    """#rrggbb for an RGB triple"""
+    return "#{:02x}{:02x}{:02x}".format(*(int(c) for c in color))
+
+
+def svg_path(points):
+    """Closed SVG path data through integer pixel-center coordinates"""
+    coords = " ".join(f"{x},{y}" for x, y in points.tolist())
+    return f"M{coords}Z"
+
+
+def render_svg(regions, unique_colors, points, filled=False):
+    """Render the outline (or filled) template as an SVG document
+
+    Coordinates are label map pixel centers, so the document is tiny and
+    scales to any print size; width and height default to the raster
+    output's dimensions. points are the regions' label points.
+    """
+    h, w = regions.shape
+    palette_height = int(h * PALETTE_HEIGHT)
+    final_width, final_height = final_dimensions(w, h)
+    total_height = final_height + int(final_height * PALETTE_HEIGHT)
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{final_width}" height="{total_height}" '
+        f'viewBox="-0.5 -0.5 {w} {h + palette_height}">',
+        f'<rect x="-0.5" y="-0.5" width="{w}" height="{h + palette_height}" fill="#fff"/>',
+        '<g stroke="#000" stroke-width="1" stroke-linejoin="round"'
+        + ('>' if filled else ' fill="none">'),
+    ]
+
+    # Region boundaries, filled with their palette color for the reference version
+    for region, path in simplify_contours(regions):
+        fill = f' fill="{hex_color(unique_colors[region.color])}"' if filled else ""
+        parts.append(f'<path d="{svg_path(path)}"{fill}/>')
+    parts.append("</g>")
+
+    # Region numbers with a white halo instead of a box
+    font_size = max(4, round(w * NUMBER_FONT_SIZE, 1))
+    parts.append(f'<g font-family="{FONT_FAMILY}" font-size="{font_size}" text-anchor="middle" '
+                 f'dominant-baseline="central" stroke="#fff" stroke-width="{font_size / 4:g}" paint-order="stroke">')
+    for region, (x, y) in zip(regions.regions, points.tolist()):
+        parts.append(f'<text x="{x}" y="{y}">{region.color + 1}</text>')
+    parts.append("</g>")
+
+    # Numbered color reference strip below the image
+    color_width = w / len(unique_colors)
+    palette_font = round(w * PALETTE_FONT_SIZE, 1)
+    parts.append(f'<g font-family="{FONT_FAMILY}" font-size="{palette_font}" text-anchor="middle" '
+                 f'stroke="#fff" stroke-width="{palette_font / 4:g}" paint-order="stroke">')
+    for i, color in enumerate(unique_colors):
+        x = i * color_width - 0.5
+        parts.append(f'<rect x="{x:.1f}" y="{h - 0.5}" width="{color_width:.1f}" height="{palette_height}" '
+                     f'fill="{hex_color(color)}" stroke="none"/>')
+        parts.append(f'<text x="{x + color_width / 2:.1f}" y="{h + palette_height * 0.7:.1f}">{i + 1}</text>')
+    parts.append("</g></svg>")
+    return "\n".join(parts).encode()
+
+
+def render_pdf(regions, unique_colors, points, filled=False):
+    """Render the outline (or filled) template as a single-page vector PDF"""
+    # Matplotlib is only needed for PDF output, so load it on demand
+    from matplotlib.backends.backend_pdf import FigureCanvasPdf
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Polygon, Rectangle
+
+    h, w = regions.shape
+    palette_height = int(h * PALETTE_HEIGHT)
+    total_height = h + palette_height
+
+    # One point per label map pixel keeps line and font sizes in the same units as the SVG
+    figure = Figure(figsize=(w / 72, total_height / 72), dpi=72)
+    FigureCanvasPdf(figure)
+    ax = figure.add_axes([0, 0, 1, 1])
+    ax.set_xlim(-0.5, w - 0.5)
+    ax.set_ylim(total_height - 0.5, -0.5)
+    ax.set_axis_off()
+
+    for region, path in simplify_contours(regions):
+        face = tuple(unique_colors[region.color] / 255) if filled else "none"
+        ax.add_patch(Polygon(path, closed=True, facecolor=face, edgecolor="black", linewidth=1,
+                             joinstyle="round"))
+
+    font_size = max(4, w * NUMBER_FONT_SIZE)
+    for region, (x, y) in zip(regions.regions, points.tolist()):
+        ax.text(x, y, str(region.color + 1), fontsize=font_size, ha="center", va="center",
+                bbox=dict(facecolor="white", edgecolor="none", pad=0.5))
+
+    color_width = w / len(unique_colors)
+    for i, color in enumerate(unique_colors):
+        x = i * color_width - 0.5
+        ax.add_patch(Rectangle((x, h - 0.5), color_width, palette_height, facecolor=tuple(color / 255),
+                               edgecolor="none"))
+        ax.text(x + color_width / 2, h + palette_height * 0.7, str(i + 1), fontsize=w * PALETTE_FONT_SIZE,
+                ha="center", va="baseline", bbox=dict(facecolor="white", edgecolor="none", pad=1))
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="pdf")
+    return buffer.getvalue()
+
+
+def render_vector(regions, unique_colors, vector_format):
+    """Render outline and filled templates as SVG or PDF documents (bytes)"""
+    renderer = {"svg": render_svg, "pdf": render_pdf}[vector_format]
+    points = label_points(regions)
+    return renderer(regions, unique_colors, points), renderer(regions, unique_colors, points, filled=True)
@@ -2,27 +2,39 @@ import logging
 import cv2
 import numpy as np
 from pathlib import Path
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from .models.upload import Upload, ProcessingStatus
-from .job_queue import JobQueue
-from sklearn.cluster import MeanShift, estimate_bandwidth
-import matplotlib.pyplot as plt
-from scipy import ndimage
-import random
-from pillow_heif import register_heif_opener
-from PIL import Image
-import io
-
-# Register HEIF opener with Pillow
-register_heif_opener()
+from .progress import publish_progress
+from .core import config
+from .core.database import get_sync_session
+from .quantize import quantize_colors
+from .cache import ArtifactCache, hash_file
+from .palette import MAX_COLORS, PaletteHierarchy, build_palette_hierarchy
+from .regions import LABEL_BYTES_PER_PIXEL, build_region_table, merge_small_regions, mode_filter
+from .render import final_dimensions, indexed_to_bgr, output_palette, render_indexed, render_outputs
+from .tiling import band_rows, map_bands
+from .decode import decode_image, probe_dimensions
+from .encode import EXTENSIONS, encode_image, write_file, write_outputs
+from .pipeline import Pipeline, Stage
+from .vector import render_vector
+from .threads import job_threads
+from .metrics import JobMetrics, record_job
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-# Use synchronous SQLite URL for the worker
-SYNC_DATABASE_URL = "sqlite:///uploads.db"
+# Working width every input is resized to before filtering
+PROCESS_WIDTH = 2048
+
+# Bytes per pixel kept by each banded stage (input band, output band and the
+# filter's own row buffers), used to size bands under the memory budget
+BLUR_BYTES_PER_PIXEL = 12
+BILATERAL_BYTES_PER_PIXEL = 12
+FILL_BYTES_PER_PIXEL = 16
+# mode_filter peaks at 4 to 5.6 bytes per pixel in measurements at every band
+# height, pure noise included (erode, dilate, padded copy, output and the
+# blockwise vote, see regions.MODE_VOTE_BLOCKS)
+MODE_BYTES_PER_PIXEL = 6
 
 def resize_image(image, target_width=2048):
     """Resize image to target width while maintaining aspect ratio if image is smaller"""
@@ -34,44 +46,18 @@ def resize_image(image, target_width=2048):
     new_height = int(height * scale)
     return cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
 
-def create_filled_version(segments_smoothed, unique_colors, h, w, min_area):
-    """Create a filled version of the paint by numbers"""
-    filled_image = np.zeros((h, w, 3), dtype=np.uint8)
-    filled_image.fill(255)  # Start with white background
-    
-    # Fill each region with its color, but only if it passes size threshold
-    for color_idx, color in enumerate(unique_colors):
-        # Create binary mask for this color
-        mask = (segments_smoothed == color_idx).astype(np.uint8)
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        # Filter small regions
-        valid_contours = [cnt for cnt in contours if cv2.contourArea(cnt) > min_area]
-        
-        # Create mask from valid contours
-        valid_mask = np.zeros((h, w), dtype=np.uint8)
-        cv2.drawContours(valid_mask, valid_contours, -1, 1, -1)  # Fill contours
-        
-        # Only fill regions that pass the size threshold
-        filled_image[valid_mask == 1] = color
-    
-    return filled_image
+def working_shape(original_shape):
+    """(height, width) of the 2K working copy of an image of the given original size"""
+    height, width = original_shape
+    return int(height * PROCESS_WIDTH / width), PROCESS_WIDTH
 
-def create_paint_by_numbers(image, n_colors=20):
-    """Convert image to paint by numbers style"""
-    logger.info("Starting paint by numbers conversion")
-    
-    # Get original dimensions for final output
-    original_h, original_w = image.shape[:2]
-    
-    # For high resolution output, target 4K width if the original is larger
-    target_width = min(3840, max(2048, original_w))  # Never go below 2K, cap at 4K
-    
-    # Calculate processing width - use 2K for consistent processing time
-    process_width = 2048
-    
-    # Resize image to processing size
-    image = resize_image(image, target_width=process_width)
+def blur_image(image, work_shape=None):
+    """Resize to the 2K working size, convert to RGB and apply an adaptive Gaussian blur"""
+    # Resize image to processing size - use 2K for consistent processing time
+    if work_shape is None:
+        image = resize_image(image, target_width=PROCESS_WIDTH)
+    else:
+        image = cv2.resize(image, (work_shape[1], work_shape[0]), interpolation=cv2.INTER_AREA)
     
     # Convert to RGB for better color processing
     if len(image.shape) == 2:  # Grayscale
@@ -87,10 +73,19 @@ def create_paint_by_numbers(image, n_colors=20):
     if kernel_size % 2 == 0:  # Ensure kernel size is odd
         kernel_size += 1
     sigma = kernel_size / 3  # Proportional sigma
-    image = cv2.GaussianBlur(image, (kernel_size, kernel_size), sigma)
+    # Bands overlap by the kernel radius so the result matches a whole-image pass
+    radius = kernel_size // 2
+    rows = band_rows(h, w, BLUR_BYTES_PER_PIXEL, overlap=radius)
+    return map_bands(lambda band: cv2.GaussianBlur(band, (kernel_size, kernel_size), sigma),
+                     image, radius, rows)
+
+def filter_image(image):
+    """Downscale the blurred working image and apply bilateral filtering"""
+    h, w = image.shape[:2]
     
-    # Step 1: Downscale for faster processing
-    process_width = 1024  # Process at lower resolution
+    # Step 1: Downscale for faster processing; smaller working copies (the fast
+    # preview) are filtered as they are
+    process_width = min(1024, w)  # Process at lower resolution
     scale = process_width / w
     process_height = int(h * scale)
     small_image = cv2.resize(image, (process_width, process_height), interpolation=cv2.INTER_AREA)
@@ -100,222 +95,228 @@ def create_paint_by_numbers(image, n_colors=20):
     d = 9  # Fixed smaller diameter
     sigma_color = 50  # Reduced from 75
     sigma_space = 50  # Reduced from 75
-    filtered = cv2.bilateralFilter(small_image, d=d, sigmaColor=sigma_color, sigmaSpace=sigma_space)
-    
-    # Step 2: Mean Shift Segmentation on downscaled image
-    logger.debug("Performing mean shift segmentation")
+    rows = band_rows(process_height, process_width, BILATERAL_BYTES_PER_PIXEL, overlap=d // 2)
+    filtered = map_bands(lambda band: cv2.bilateralFilter(band, d=d, sigmaColor=sigma_color, sigmaSpace=sigma_space),
+                         small_image, d // 2, rows)
+
+    return filtered
+
+def quantize_image(filtered, quantizer=None):
+    """Quantize the filtered image at the largest color count
+
+    quantizer names the color quantization engine (see quantize.QUANTIZERS);
+    it defaults to the configured engine. Smaller color counts are merges of
+    this palette.
+    """
+    logger.debug("Quantizing colors")
+    process_height, process_width = filtered.shape[:2]
     flat_image = filtered.reshape((-1, 3))
     
-    # Use fixed bandwidth and reduced samples for faster processing
-    bandwidth = 0.8  # Fixed bandwidth instead of estimation
-    
-    # Use KMeans directly instead of Mean Shift for faster processing
-    from sklearn.cluster import KMeans
-    kmeans = KMeans(n_clusters=n_colors, random_state=42, max_iter=100)
-    labels = kmeans.fit_predict(flat_image)
-    unique_colors = np.uint8(kmeans.cluster_centers_)
-    
-    # Upscale the labels back to target size
-    labels_image = labels.reshape(process_height, process_width)
-    labels = cv2.resize(labels_image.astype(np.float32), (w, h), 
-                       interpolation=cv2.INTER_NEAREST).astype(np.int32)
-    
-    # Step 3: Create edge mask using adaptive thresholding
-    logger.debug("Creating edge mask")
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    edges = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, 
-                                cv2.THRESH_BINARY, 9, 2)
-    
-    # Step 4: Simplified morphological operations
-    logger.debug("Applying morphological operations")
-    kernel = np.ones((3, 3), np.uint8)  # Fixed small kernel
+    fine_labels, fine_colors = quantize_colors(flat_image, MAX_COLORS,
+                                               engine=quantizer or config.QUANTIZER,
+                                               seed=config.QUANTIZER_SEED)
+    return fine_labels.reshape(process_height, process_width), fine_colors
+
+def build_regions(hierarchy, n_colors=20):
+    """Smoothed label map, palette and region table for n_colors from a palette hierarchy"""
+    h, w = hierarchy.work_shape
     
-    # Reshape labels back to image dimensions
-    segments = labels
+    # Look up the label map for this color count and upscale it back to working size.
+    # At most MAX_COLORS labels, so the map stays uint8 throughout.
+    labels_image, unique_colors = hierarchy.palette(n_colors)
+    segments = cv2.resize(labels_image.astype(np.uint8), (w, h), interpolation=cv2.INTER_NEAREST)
     
-    # Apply median filter to remove noise
-    segments_smoothed = ndimage.median_filter(segments, size=3)
+    # Majority filter to remove noise, one row of overlap per band
+    rows = band_rows(h, w, MODE_BYTES_PER_PIXEL, overlap=1)
+    segments_smoothed = map_bands(mode_filter, segments, 1, rows)
+    del segments
     
     # Calculate minimum area threshold
     min_area = (w * h) // 50000  # Increased divisor for fewer small regions
     
-    # Step 5: Create outline image
-    logger.debug("Creating outlines")
-    outline_image = np.zeros((h, w, 3), dtype=np.uint8)
-    outline_image.fill(255)  # White background
-    
-    # Create filled version with only valid regions
-    filled_image = create_filled_version(segments_smoothed, unique_colors, h, w, min_area)
-    
-    # Draw region boundaries
-    for color_idx in range(len(unique_colors)):
-        mask = (segments_smoothed == color_idx).astype(np.uint8)
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        # Filter small regions
-        contours = [cnt for cnt in contours if cv2.contourArea(cnt) > min_area]
-        
-        # Draw contours with thin lines
-        cv2.drawContours(outline_image, contours, -1, (0, 0, 0), 1)
-        cv2.drawContours(filled_image, contours, -1, (0, 0, 0), 1)
-        
-        # Add numbers to regions
-        for contour in contours:
-            M = cv2.moments(contour)
-            if M["m00"] != 0:
-                cX = int(M["m10"] / M["m00"])
-                cY = int(M["m01"] / M["m00"])
-                
-                # Calculate adaptive font scale based on image width
-                base_font_scale = 0.4  # Increased base font size from 0.3
-                font_scale = max(base_font_scale, (target_width / 2048) * base_font_scale)  # Scale up with resolution
-                
-                # Draw number with white background for better visibility
-                number = str(color_idx + 1)
-                font = cv2.FONT_HERSHEY_SIMPLEX
-                thickness = max(1, int(target_width / 2048))  # Adaptive thickness
-                
-                # Get text size
-                (text_width, text_height), _ = cv2.getTextSize(number, font, font_scale, thickness)
-                
-                # Draw white background rectangle with increased padding
-                padding = max(2, int(target_width / 640))  # Adaptive padding
-                
-                # Add numbers to both versions
-                for target_image in [outline_image, filled_image]:
-                    cv2.rectangle(target_image, 
-                                (cX - text_width//2 - padding, cY - text_height//2 - padding),
-                                (cX + text_width//2 + padding, cY + text_height//2 + padding),
-                                (255, 255, 255), -1)
-                    cv2.putText(target_image, number, (cX - text_width//2, cY + text_height//2),
-                              font, font_scale, (0, 0, 0), thickness)
-    
-    # Calculate final dimensions maintaining aspect ratio
-    final_scale = target_width / original_w
-    final_width = int(target_width)
-    final_height = int(original_h * final_scale)
-    
-    # Ensure minimum size for visibility
-    final_width = max(3840, final_width)
-    final_height = max(int(3840 * (original_h / original_w)), final_height)
-    
-    # Upscale both versions to final resolution with appropriate interpolation
-    outline_image = cv2.resize(outline_image, (final_width, final_height), interpolation=cv2.INTER_LANCZOS4)
-    filled_image = cv2.resize(filled_image, (final_width, final_height), interpolation=cv2.INTER_LANCZOS4)
-    
-    # Redraw contours at high resolution for sharpness
-    for color_idx in range(len(unique_colors)):
-        mask = cv2.resize((segments_smoothed == color_idx).astype(np.uint8), 
-                         (final_width, final_height), 
-                         interpolation=cv2.INTER_NEAREST)
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        # Filter small regions using scaled min_area
-        scaled_min_area = (final_width * final_height) // 50000
-        contours = [cnt for cnt in contours if cv2.contourArea(cnt) > scaled_min_area]
-        
-        # Draw sharp contours
-        cv2.drawContours(outline_image, contours, -1, (0, 0, 0), max(1, int(final_width / 2048)))
-        cv2.drawContours(filled_image, contours, -1, (0, 0, 0), max(1, int(final_width / 2048)))
-        
-        # Add numbers with proper scaling
-        for contour in contours:
-            M = cv2.moments(contour)
-            if M["m00"] != 0:
-                cX = int(M["m10"] / M["m00"])
-                cY = int(M["m01"] / M["m00"])
-                
-                # Calculate font scale based on final resolution
-                base_font_scale = 0.4  # Increased base size
-                font_scale = max(base_font_scale, (final_width / 2048) * base_font_scale)
-                
-                number = str(color_idx + 1)
-                font = cv2.FONT_HERSHEY_SIMPLEX
-                thickness = max(1, int(final_width / 1024))  # Thicker font for visibility
-                
-                # Get text size
-                (text_width, text_height), _ = cv2.getTextSize(number, font, font_scale, thickness)
-                
-                # Increased padding for better visibility
-                padding = max(2, int(final_width / 512))
-                
-                # Add numbers to both versions with white background
-                for target_image in [outline_image, filled_image]:
-                    cv2.rectangle(target_image, 
-                                (cX - text_width//2 - padding, cY - text_height//2 - padding),
-                                (cX + text_width//2 + padding, cY + text_height//2 + padding),
-                                (255, 255, 255), -1)
-                    cv2.putText(target_image, number, (cX - text_width//2, cY + text_height//2),
-                              font, font_scale, (0, 0, 0), thickness)
-    
-    # Create color palette reference at new size with larger height
-    palette_height = int(final_height * 0.08)  # Increased from 0.05 for better visibility
-    palette = np.zeros((palette_height, final_width, 3), dtype=np.uint8)
-    palette.fill(255)
-    
-    # Calculate width for each color in palette
-    n_unique_colors = len(unique_colors)
-    color_width = final_width // n_unique_colors
+    # Fold regions below the minimum area into their most similar neighbor
+    logger.debug("Merging small regions")
+    label_rows = band_rows(h, w, LABEL_BYTES_PER_PIXEL)
+    segments_smoothed, components = merge_small_regions(segments_smoothed, unique_colors, min_area, rows=label_rows)
     
-    # Draw palette with larger numbers
-    for i, color in enumerate(unique_colors):
-        x1 = i * color_width
-        x2 = (i + 1) * color_width if i < n_unique_colors - 1 else final_width
-        
-        # Draw color rectangle
-        cv2.rectangle(palette, (x1, 0), (x2, palette_height), color.tolist(), -1)
-        
-        # Add number with larger font
-        number = str(i + 1)
-        font_scale_palette = max(0.8, (final_width / 2048) * 1.5)  # Larger palette numbers
-        thickness = max(1, int(final_width / 1024))
+    # Build the region table from the merge's labels; every render step below reuses it
+    logger.debug("Building region table")
+    regions = build_region_table(segments_smoothed, min_area, components=components)
+    return segments_smoothed, unique_colors, regions
+
+def render_raster(hierarchy, segments, unique_colors, regions):
+    """Render outline and filled images directly at final resolution
+
+    Returns the BGR images followed by their output_palette index images,
+    which full-size PNGs are encoded from directly.
+    """
+    original_h, original_w = hierarchy.original_shape
+    final_width, final_height = final_dimensions(original_w, original_h)
+    outline_indices, filled_indices = render_indexed(segments, unique_colors, regions, final_width, final_height,
+                                                     rows=band_rows(final_height, final_width, FILL_BYTES_PER_PIXEL))
+    palette = output_palette(unique_colors)
+    return (indexed_to_bgr(outline_indices, palette), indexed_to_bgr(filled_indices, palette),
+            outline_indices, filled_indices)
+
+# The conversion as named stages. Each stage declares the artifacts it reads
+# and writes; a run only executes the stages its targets depend on, and
+# persisted stages resume from the artifact cache.
+PIPELINE = Pipeline([
+    Stage("probe", lambda input_path: {"original_shape": probe_dimensions(input_path)},
+          inputs=("input_path",), outputs=("original_shape",)),
+    Stage("decode", lambda input_path: {"image": decode_image(input_path, min_width=PROCESS_WIDTH)[0]},
+          inputs=("input_path",), outputs=("image",), progress="decoding"),
+    Stage("work_shape", lambda original_shape: {"work_shape": working_shape(original_shape)},
+          inputs=("original_shape",), outputs=("work_shape",)),
+    Stage("blur", lambda image, work_shape: {"blurred": blur_image(image, work_shape)},
+          inputs=("image", "work_shape"), outputs=("blurred",), persist=True),
+    Stage("filter", lambda blurred: {"filtered": filter_image(blurred)},
+          inputs=("blurred",), outputs=("filtered",), persist=True, progress="quantizing"),
+    Stage("quantize",
+          lambda filtered, quantizer, seed: dict(zip(("fine_labels", "fine_colors"),
+                                                     quantize_image(filtered, quantizer=quantizer))),
+          inputs=("filtered",), outputs=("fine_labels", "fine_colors"), params=("quantizer", "seed"),
+          progress="quantizing"),
+    Stage("hierarchy",
+          lambda fine_labels, fine_colors, work_shape, original_shape, colors: {
+              "hierarchy": build_palette_hierarchy(fine_labels, fine_colors, work_shape, original_shape)},
+          inputs=("fine_labels", "fine_colors", "work_shape", "original_shape"), outputs=("hierarchy",),
+          params=("colors",), persist=True, compress=True, durable=True,
+          dump=lambda outputs: outputs["hierarchy"].to_arrays(),
+          load=lambda arrays: {"hierarchy": PaletteHierarchy.from_arrays(arrays)}),
+    Stage("regions",
+          lambda hierarchy, n_colors: dict(zip(("segments", "unique_colors", "regions"),
+                                               build_regions(hierarchy, n_colors))),
+          inputs=("hierarchy",), outputs=("segments", "unique_colors", "regions"), params=("n_colors",),
+          progress="rendering"),
+    Stage("raster",
+          lambda *artifacts: dict(zip(("outline_image", "filled_image", "outline_indices", "filled_indices"),
+                                      render_raster(*artifacts))),
+          inputs=("hierarchy", "segments", "unique_colors", "regions"),
+          outputs=("outline_image", "filled_image", "outline_indices", "filled_indices"), progress="rendering"),
+    Stage("vector",
+          lambda unique_colors, regions, vector_format: dict(zip(("outline_document", "filled_document"),
+                                                                 render_vector(regions, unique_colors, vector_format))),
+          inputs=("unique_colors", "regions"), outputs=("outline_document", "filled_document"),
+          params=("vector_format",), progress="rendering"),
+])
+
+def pipeline_params(n_colors=20, quantizer=None, vector_format=None):
+    """Parameter set of a pipeline run"""
+    return {"n_colors": n_colors, "quantizer": quantizer or config.QUANTIZER, "seed": config.QUANTIZER_SEED,
+            "colors": MAX_COLORS, "vector_format": vector_format}
+
+def output_targets(vector_format=None):
+    """Artifacts holding the outline and filled outputs of a run"""
+    return ("outline_document", "filled_document") if vector_format else ("outline_image", "filled_image")
+
+def create_palette_hierarchy(image, quantizer=None):
+    """Blur, filter and quantize an image once into a palette hierarchy for every color count"""
+    logger.info("Building palette hierarchy")
+    artifacts = PIPELINE.run(["hierarchy"], {"image": image, "original_shape": image.shape[:2]},
+                             pipeline_params(quantizer=quantizer))
+    return artifacts["hierarchy"]
+
+def render_paint_by_numbers(hierarchy, n_colors=20, vector_format=None):
+    """Render outline and filled images for n_colors from a palette hierarchy
+
+    With vector_format ("svg" or "pdf") the two images are returned as
+    encoded vector documents drawn from the region contours, skipping the
+    high-resolution raster stage.
+    """
+    logger.info(f"Rendering paint by numbers with {n_colors} colors")
+    targets = output_targets(vector_format)
+    artifacts = PIPELINE.run(targets, {"hierarchy": hierarchy}, pipeline_params(n_colors, vector_format=vector_format))
+    return tuple(artifacts[target] for target in targets)
+
+def create_paint_by_numbers(image, n_colors=20, quantizer=None, vector_format=None):
+    """Convert image to paint by numbers style, as raster images or SVG/PDF documents"""
+    logger.info("Starting paint by numbers conversion")
+    targets = output_targets(vector_format)
+    artifacts = PIPELINE.run(targets, {"image": image, "original_shape": image.shape[:2]},
+                             pipeline_params(n_colors, quantizer, vector_format))
+    return tuple(artifacts[target] for target in targets)
+
+def create_fast_preview(image, n_colors=20):
+    """Low-resolution filled template for the fast preview tier
+
+    Runs the regular stages on a FAST_PREVIEW_WIDTH-wide working copy with
+    the FAST_PREVIEW_QUANTIZER engine, without the artifact cache, and
+    draws the result at twice that width so region numbers stay legible.
+    """
+    height, width = image.shape[:2]
+    work_shape = (max(1, int(height * config.FAST_PREVIEW_WIDTH / width)), config.FAST_PREVIEW_WIDTH)
+    artifacts = PIPELINE.run(["segments", "unique_colors", "regions"],
+                             {"image": image, "original_shape": work_shape, "work_shape": work_shape},
+                             pipeline_params(n_colors, config.FAST_PREVIEW_QUANTIZER))
+    _, filled_image = render_outputs(artifacts["segments"], artifacts["unique_colors"], artifacts["regions"],
+                                     2 * work_shape[1], 2 * work_shape[0])
+    return filled_image
+
+def process_preview(upload_id: str) -> bool:
+    """Write the fast preview of a waiting upload, returning whether it succeeded
+
+    Uploads whose full render already finished, failed or was cancelled are
+    skipped. A failed preview leaves the upload untouched; its full render
+    is queued separately and still runs.
+    """
+    session = get_sync_session()
+    try:
+        upload = session.query(Upload).filter(Upload.id == upload_id).first()
+        if not upload or upload.status not in (ProcessingStatus.PENDING, ProcessingStatus.PROCESSING):
+            return True
         
-        (text_width, text_height), _ = cv2.getTextSize(number, font, font_scale_palette, thickness)
-        text_x = x1 + (x2 - x1)//2 - text_width//2
-        text_y = palette_height - max(20, int(palette_height / 3))
+        uploads_dir = Path("uploads")
+        image, _ = decode_image(uploads_dir / upload.filename, min_width=config.FAST_PREVIEW_WIDTH)
+        with job_threads():
+            preview = create_fast_preview(image, upload.color_count)
+        filename = f"fast_preview_{upload.id}{EXTENSIONS[config.PREVIEW_FORMAT]}"
+        write_file(uploads_dir / filename, encode_image(preview, config.PREVIEW_FORMAT, config.PREVIEW_QUALITY))
+        upload.fast_preview_filename = filename
+        session.commit()
         
-        # Draw number with white background
-        padding = max(4, int(final_width / 512))
-        cv2.rectangle(palette,
-                     (text_x - padding, text_y - text_height - padding),
-                     (text_x + text_width + padding, text_y + padding),
-                     (255, 255, 255), -1)
-        cv2.putText(palette, number, (text_x, text_y),
-                    font, font_scale_palette, (0, 0, 0), thickness)
-    
-    # Combine images with palettes
-    outline_final = np.vstack([outline_image, palette])
-    filled_final = np.vstack([filled_image, palette])
-    
-    return cv2.cvtColor(outline_final, cv2.COLOR_RGB2BGR), cv2.cvtColor(filled_final, cv2.COLOR_RGB2BGR)
+        # The full render may have finished meanwhile; never replace its final event
+        if upload.status in (ProcessingStatus.PENDING, ProcessingStatus.PROCESSING):
+            publish_progress(upload_id, "preview", upload=upload.to_dict())
+        return True
+    except Exception as e:
+        logger.error(f"Error creating fast preview for {upload_id}: {e}")
+        session.rollback()
+        return False
+    finally:
+        session.close()
+
+def fail_upload(upload_id: str, error: str):
+    """Mark an upload whose job was given up on as failed and tell its listeners
 
-def convert_heic_to_jpeg(file_path):
-    """Convert HEIC file to JPEG format and return as numpy array"""
+    Used for jobs that never reach process_image's own error handling, such
+    as jobs whose lease kept expiring because their worker died.
+    """
+    session = get_sync_session()
     try:
-        # Open the HEIC file with Pillow
-        with Image.open(file_path) as img:
-            # Convert to RGB mode
-            img = img.convert('RGB')
-            # Save to bytes buffer
-            buffer = io.BytesIO()
-            img.save(buffer, format='JPEG')
-            buffer.seek(0)
-            # Convert to numpy array
-            jpeg_array = np.frombuffer(buffer.getvalue(), dtype=np.uint8)
-            # Decode the JPEG buffer to image
-            return cv2.imdecode(jpeg_array, cv2.IMREAD_COLOR)
+        upload = session.query(Upload).filter(Upload.id == upload_id).first()
+        if upload and upload.status in (ProcessingStatus.PENDING, ProcessingStatus.PROCESSING):
+            upload.status = ProcessingStatus.FAILED
+            upload.error_message = error
+            session.commit()
+        publish_progress(upload_id, "failed", error=error, upload=upload.to_dict() if upload else None)
     except Exception as e:
-        logger.error(f"Error converting HEIC file: {e}")
-        return None
+        logger.error(f"Error failing upload {upload_id}: {e}")
+        session.rollback()
+    finally:
+        session.close()
 
-def process_image(upload_id: str):
-    """Process an uploaded image"""
+def process_image(upload_id: str, queue_wait: float = None, lane: str = None) -> bool:
+    """Process an uploaded image, returning whether it succeeded
+
+    queue_wait and lane, when the caller knows them, are recorded with the
+    job's stage timings and peak RSS on the upload and in the shared metrics.
+    """
     logger.info(f"Processing image {upload_id}")
     
-    # Create database session
-    engine = create_engine(SYNC_DATABASE_URL)
-    Session = sessionmaker(bind=engine)
-    session = Session()
+    # Create database session on the process's pooled engine
+    session = get_sync_session()
+    upload = None
     
     try:
         # Get upload from database
@@ -327,58 +328,91 @@ def process_image(upload_id: str):
         upload.status = ProcessingStatus.PROCESSING
         session.commit()
         
-        # Construct file paths, always using .jpg extension for processed files
+        # Outputs are named after the upload so re-renders of one input never collide
         uploads_dir = Path("uploads")
         input_path = uploads_dir / upload.filename
-        base_filename = Path(upload.filename).stem
-        output_path = uploads_dir / f"processed_{base_filename}.jpg"
-        filled_path = uploads_dir / f"processed_filled_{base_filename}.jpg"
         
         # Check if input file exists
         if not input_path.exists():
             raise ValueError("Input file not found")
         
-        # Read the image based on file extension
-        file_extension = input_path.suffix.lower()
-        if file_extension in ['.heic', '.heif']:
-            # Handle HEIC/HEIF files
-            image = convert_heic_to_jpeg(input_path)
-            if image is None:
-                raise ValueError("Failed to convert HEIC file")
+        # Uploads are content addressed; older records get their hash computed here
+        if not upload.content_hash:
+            upload.content_hash = hash_file(input_path)
+        
+        # Run only the stages this upload needs. Repeats and re-renders resume
+        # from the persisted intermediates of the same content.
+        cache = ArtifactCache()
+        params = pipeline_params(upload.color_count, upload.quantizer, upload.vector_format)
+        inputs = {"input_path": input_path}
+        legacy_palette = uploads_dir / upload.palette_filename if upload.palette_filename else None
+        if legacy_palette and legacy_palette.is_file():
+            # Hierarchies stored next to the uploads before the artifact cache existed
+            with np.load(legacy_palette) as arrays:
+                inputs["hierarchy"] = PaletteHierarchy.from_arrays(arrays)
         else:
-            # Handle regular image files
-            image = cv2.imread(str(input_path))
-            
-        if image is None:
-            raise ValueError("Failed to read image file")
-            
-        # Create paint by numbers version with specified color count
-        outline_image, filled_image = create_paint_by_numbers(image, n_colors=upload.color_count)
+            upload.palette_filename = PIPELINE.artifact_key(cache, upload.content_hash, "hierarchy", params)
+        targets = output_targets(upload.vector_format)
+        job_metrics = JobMetrics()
+        # The job keeps OpenCV, KMeans and its own steps within its thread budget
+        with job_threads():
+            artifacts = PIPELINE.run(targets, inputs, params, cache=cache,
+                                     content_hash=upload.content_hash,
+                                     on_stage=lambda stage: publish_progress(upload_id, stage),
+                                     monitor=job_metrics.stage)
+        outline_image, filled_image = (artifacts[target] for target in targets)
         
-        # Save the processed images as JPG
-        cv2.imwrite(str(output_path), outline_image)
-        cv2.imwrite(str(filled_path), filled_image)
+        if upload.vector_format:
+            # Vector documents are already encoded and need no previews
+            publish_progress(upload_id, "encoding")
+            upload.processed_filename = f"processed_{upload.id}.{upload.vector_format}"
+            upload.filled_filename = f"processed_filled_{upload.id}.{upload.vector_format}"
+            output_files = [upload.processed_filename, upload.filled_filename]
+            with job_metrics.stage("encode"):
+                write_file(uploads_dir / upload.processed_filename, outline_image)
+                write_file(uploads_dir / upload.filled_filename, filled_image)
+        else:
+            # Encode full-size outputs, previews and thumbnail in one pass. The
+            # full-size images are drawn as palette indices, so PNGs are
+            # written from those directly.
+            publish_progress(upload_id, "encoding")
+            palette = output_palette(artifacts["unique_colors"])
+            with job_metrics.stage("encode"):
+                outputs = write_outputs(uploads_dir, upload.id, outline_image, filled_image, palette,
+                                        indices=(artifacts["outline_indices"], artifacts["filled_indices"]))
+            for column, filename in outputs.items():
+                setattr(upload, column, filename)
+            output_files = list(outputs.values())
         
-        # Update upload record with processed filenames (using .jpg extension)
-        upload.processed_filename = f"processed_{base_filename}.jpg"
-        upload.filled_filename = f"processed_filled_{base_filename}.jpg"
+        # Per-stage wall time and peak RSS, queue wait and file sizes
+        input_bytes = input_path.stat().st_size
+        output_bytes = sum((uploads_dir / filename).stat().st_size for filename in output_files)
+        upload.metrics = {
+            "stages": job_metrics.stages,
+            "totalSeconds": job_metrics.total_seconds(),
+            "queueWait": queue_wait,
+            "lane": lane,
+            "inputBytes": input_bytes,
+            "outputBytes": output_bytes,
+        }
+        record_job(job_metrics, queue_wait=queue_wait, lane=lane, input_bytes=input_bytes, output_bytes=output_bytes)
         upload.status = ProcessingStatus.COMPLETED
         session.commit()
+        publish_progress(upload_id, "done", upload=upload.to_dict())
         
         logger.info(f"Successfully processed image {upload_id}")
+        return True
         
     except Exception as e:
         logger.error(f"Error processing image {upload_id}")
         logger.error(str(e))
         # Update status to failed
+        session.rollback()
         if upload:
             upload.status = ProcessingStatus.FAILED
             upload.error_message = str(e)
             session.commit()
+        publish_progress(upload_id, "failed", error=str(e), upload=upload.to_dict() if upload else None)
+        return False
     finally:
         session.close()
-
-def enqueue_processing(upload_id: str):
-    """Enqueue an image for processing"""
-    queue = JobQueue()
-    return queue.enqueue(upload_id) 
\ No newline at end of file
@@ -0,0 +1,67 @@
+import math
+from pathlib import Path
+import cv2
+import numpy as np
+from PIL import Image
+from app import decode  # noqa: F401  (registers the HEIF codec with Pillow)
+
+# Input formats the benchmark writes synthetic images in
+FORMATS = {"jpeg": ".jpg", "png": ".png", "heic": ".heic"}
+
+# Aspect ratio (width / height) of synthetic images, as from a typical camera
+ASPECT = 1.5
+
+
+def dimensions(megapixels):
+    """(width, height) of a synthetic image of about this many megapixels"""
+    width = round(math.sqrt(megapixels * 1_000_000 * ASPECT))
+    return width, round(width / ASPECT)
+
+
+def synthetic_image(megapixels, seed=0):
+    """A deterministic photo-like BGR image
+
+    Smooth color gradients with overlapping shapes and fine grain, so
+    quantization, region merging and encoding all see realistic work.
+    """
+    width, height = dimensions(megapixels)
+    rng = np.random.default_rng(seed)
+    cv2.setRNGSeed(seed)
+
+    # Low-frequency color field upscaled to full size
+    field = rng.integers(0, 256, (height // 128 + 2, width // 128 + 2, 3), dtype=np.uint8)
+    image = cv2.resize(field, (width, height), interpolation=cv2.INTER_CUBIC)
+
+    # Flat shapes give the region table clear edges to find
+    scale = width / 1000
+    for _ in range(300):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        color = rng.integers(0, 256, 3).tolist()
+        if rng.random() < 0.5:
+            cv2.circle(image, center, int(rng.integers(5, 60) * scale), color, -1)
+        else:
+            size = (int(rng.integers(5, 80) * scale), int(rng.integers(5, 80) * scale))
+            cv2.ellipse(image, center, size, float(rng.integers(0, 180)), 0, 360, color, -1)
+
+    # Sensor-like grain
+    grain = np.empty_like(image)
+    cv2.randu(grain, 0, 16)
+    return cv2.subtract(cv2.add(image, grain), 8)
+
+
+def write_image(image, path, image_format):
+    """Encode a BGR image to path in one of FORMATS"""
+    if image_format == "heic":
+        Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)).save(path, quality=90)
+    elif not cv2.imwrite(str(path), image, [cv2.IMWRITE_JPEG_QUALITY, 92] if image_format == "jpeg" else []):
+        raise ValueError(f"Could not write {path}")
+
+
+def synthetic_file(megapixels, image_format, directory):
+    """Path of a synthetic input file, generated on first use and reused afterwards"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"synthetic_{megapixels}mp{FORMATS[image_format]}"
+    if not path.exists():
+        write_image(synthetic_image(megapixels), path, image_format)
+    return path
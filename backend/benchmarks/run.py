@@ -0,0 +1,171 @@
+"""Time and measure the conversion pipeline stage by stage
+
+Run from the backend directory:
+
+    python -m benchmarks.run                      # run the matrix and print results
+    python -m benchmarks.run --save-baseline      # store the results as the baseline
+    python -m benchmarks.run --compare            # exit 1 on regressions against the baseline
+
+Every case converts an input file through the worker's pipeline (decode to
+encode) without the artifact cache. Stage times are the median of --repeat
+runs; peak memory is measured in a separate traced run, since tracing slows
+Python-heavy stages down.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from app.core import config
+from app.encode import write_outputs
+from app.threads import job_threads
+from app.worker import PIPELINE, output_palette, output_targets, pipeline_params
+from .images import FORMATS, synthetic_file
+
+BENCHMARK_DIR = Path(__file__).parent
+DEFAULT_BASELINE = BENCHMARK_DIR / "baseline.json"
+DEFAULT_FIXTURES = BENCHMARK_DIR / "fixtures"
+IMAGE_CACHE = BENCHMARK_DIR / ".images"
+
+DEFAULT_SIZES = (1, 12, 48)
+DEFAULT_COLORS = (2, 20, 30)
+
+# Differences below these are noise, whatever the ratio
+MIN_SECONDS = 0.02
+MIN_MB = 2.0
+
+
+@contextmanager
+def timer(timings, name):
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
+
+
+@contextmanager
+def traced(peaks, name):
+    # Peak traced allocation of this stage on top of what was live when it started
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    yield
+    peaks[name] = (tracemalloc.get_traced_memory()[1] - baseline) / 1024 ** 2
+
+
+def convert(input_path, n_colors, output_dir, measure, results):
+    """One full conversion, calling measure(results, stage) around every stage"""
+    artifacts = PIPELINE.run(output_targets(), {"input_path": input_path}, pipeline_params(n_colors),
+                             monitor=lambda stage: measure(results, stage))
+    outline_image, filled_image = (artifacts[target] for target in output_targets())
+    palette = output_palette(artifacts["unique_colors"])
+    with measure(results, "encode"):
+        write_outputs(output_dir, "benchmark", outline_image, filled_image, palette,
+                      indices=(artifacts["outline_indices"], artifacts["filled_indices"]))
+
+
+def run_case(input_path, n_colors, repeat):
+    """Median seconds and peak MB of every stage for one input and color count"""
+    with tempfile.TemporaryDirectory() as output_dir, job_threads():
+        runs = []
+        for _ in range(repeat):
+            timings = {}
+            convert(input_path, n_colors, output_dir, timer, timings)
+            runs.append(timings)
+
+        peaks = {}
+        tracemalloc.start()
+        try:
+            convert(input_path, n_colors, output_dir, traced, peaks)
+        finally:
+            tracemalloc.stop()
+
+    stages = {name: {"seconds": round(statistics.median(run[name] for run in runs), 4),
+                     "peak_mb": round(peaks.get(name, 0.0), 1)}
+              for name in runs[0]}
+    return {"stages": stages, "total_seconds": round(sum(stage["seconds"] for stage in stages.values()), 4)}
+
+
+def cases(sizes, colors, formats, fixtures):
+    """(name, input path, color count) of every case in the matrix"""
+    inputs = [(f"{size}mp-{image_format}", synthetic_file(size, image_format, IMAGE_CACHE))
+              for size in sizes for image_format in formats]
+    if fixtures and Path(fixtures).is_dir():
+        inputs += [(f"fixture-{path.name}", path) for path in sorted(Path(fixtures).iterdir())
+                   if path.suffix.lower() in (".jpg", ".jpeg", ".png", ".heic", ".heif", ".webp", ".gif")]
+    return [(f"{name}-{n_colors}c", path, n_colors) for name, path in inputs for n_colors in colors]
+
+
+def compare(baseline, results, threshold):
+    """Regressions of results against a baseline, as printable lines"""
+    regressions = []
+    for case, result in results["cases"].items():
+        before = baseline["cases"].get(case)
+        if before is None:
+            continue
+        for stage, now in result["stages"].items():
+            then = before["stages"].get(stage)
+            if then is None:
+                continue
+            for metric, floor in (("seconds", MIN_SECONDS), ("peak_mb", MIN_MB)):
+                if now[metric] > then[metric] * (1 + threshold) and now[metric] - then[metric] > floor:
+                    regressions.append(f"{case} {stage} {metric}: {then[metric]} -> {now[metric]} "
+                                       f"(+{(now[metric] / max(then[metric], 1e-9) - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_case(name, result):
+    print(f"\n{name}  total {result['total_seconds']:.3f}s")
+    for stage, stats in result["stages"].items():
+        print(f"  {stage:<12} {stats['seconds']:>9.4f}s {stats['peak_mb']:>9.1f} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the image pipeline stages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Synthetic image sizes in megapixels")
+    parser.add_argument("--colors", type=int, nargs="+", default=DEFAULT_COLORS, help="Color counts to render")
+    parser.add_argument("--formats", nargs="+", choices=sorted(FORMATS), default=sorted(FORMATS),
+                        help="Input formats of the synthetic images")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="Directory of extra input images")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare against the baseline and fail on regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown or growth, as a fraction")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    results = {
+        "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                    "cpus": os.cpu_count(), "threads": config.WORKER_THREADS},
+        "cases": {},
+    }
+    for name, input_path, n_colors in cases(args.sizes, args.colors, args.formats, args.fixtures):
+        results["cases"][name] = run_case(input_path, n_colors, args.repeat)
+        print_case(name, results["cases"][name])
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(results, indent=2))
+        print(f"\nBaseline saved to {args.baseline}")
+    if args.compare:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline["machine"] != results["machine"]:
+            print("\nWarning: baseline was recorded on a different machine or thread budget")
+        regressions = compare(baseline, results, args.threshold)
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold * 100:.0f}%")
+        for line in regressions:
+            print(f"  {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
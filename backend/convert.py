@@ -0,0 +1,169 @@
+"""Convert images to paint by numbers templates offline, without Redis or the database
+
+    python convert.py photos/ "scans/**/*.jpg" -o out/ --colors 20 --processes 8
+
+Directories are searched for images (recursively with -r), globs are
+expanded and plain paths are taken as they are. Outputs are written as the
+worker writes them, mirroring each input's directory below its directory
+argument or below the glob's wildcard-free prefix. Inputs whose outputs all
+exist are skipped unless --overwrite is given, so an interrupted run resumes
+where it stopped.
+"""
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from app.core import config
+from app.encode import EXTENSIONS
+from app.options import QUANTIZERS, VECTOR_FORMATS
+
+# Inputs picked up from directories
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff", ".gif", ".heic", ".heif"}
+
+
+def glob_root(pattern):
+    """Leading directories of a glob pattern that hold no wildcards"""
+    parts = Path(pattern).parts
+    root = Path()
+    for part in parts[:-1]:
+        if glob.has_magic(part):
+            break
+        root /= part
+    return root
+
+
+def find_inputs(arguments, recursive=False):
+    """(input path, output subdirectory) of every image named by directories, globs or paths
+
+    Directory and glob inputs keep their directories below the directory
+    argument or the glob's wildcard-free prefix.
+    """
+    inputs = {}
+    for argument in arguments:
+        path = Path(argument)
+        if path.is_dir():
+            pattern = "**/*" if recursive else "*"
+            for file in sorted(path.glob(pattern)):
+                if file.is_file() and file.suffix.lower() in IMAGE_EXTENSIONS:
+                    inputs.setdefault(file, file.parent.relative_to(path))
+        elif path.is_file():
+            inputs.setdefault(path, Path())
+        else:
+            root = glob_root(argument)
+            for match in sorted(glob.glob(argument, recursive=True)):
+                if Path(match).is_file():
+                    inputs.setdefault(Path(match), Path(match).parent.relative_to(root))
+    return list(inputs.items())
+
+
+def output_names(base_name, vector_format=None):
+    """Files a finished conversion leaves behind, the same set the worker writes"""
+    if vector_format:
+        return [f"processed_{base_name}.{vector_format}", f"processed_filled_{base_name}.{vector_format}"]
+    full_ext = EXTENSIONS[config.OUTPUT_FORMAT]
+    preview_ext = EXTENSIONS[config.PREVIEW_FORMAT]
+    return [f"processed_{base_name}{full_ext}", f"processed_filled_{base_name}{full_ext}",
+            f"preview_{base_name}{preview_ext}", f"preview_filled_{base_name}{preview_ext}",
+            f"thumbnail_{base_name}{preview_ext}"]
+
+
+def init_process(threads):
+    """Give each pool process its share of the cores and quiet the worker's debug logging"""
+    config.WORKER_THREADS = threads
+    logging.disable(logging.INFO)
+
+
+def convert_file(input_path, output_dir, base_name, n_colors, quantizer, vector_format, threads):
+    """Convert one image and write its outputs, returning the seconds it took"""
+    # The image stack is only imported inside the pool processes
+    from app.encode import write_file, write_outputs
+    from app.threads import job_threads
+    from app.worker import PIPELINE, output_palette, output_targets, pipeline_params
+
+    start = time.perf_counter()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    targets = output_targets(vector_format)
+    # The same stages the worker runs, from decoding the file to the outputs
+    with job_threads(threads):
+        artifacts = PIPELINE.run(targets, {"input_path": input_path}, pipeline_params(n_colors, quantizer, vector_format))
+        outline, filled = (artifacts[target] for target in targets)
+        if vector_format:
+            for filename, document in zip(output_names(base_name, vector_format), (outline, filled)):
+                write_file(output_dir / filename, document)
+        else:
+            write_outputs(output_dir, base_name, outline, filled, output_palette(artifacts["unique_colors"]),
+                          indices=(artifacts["outline_indices"], artifacts["filled_indices"]))
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert images to paint by numbers templates offline")
+    parser.add_argument("inputs", nargs="+", help="Image files, directories or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="Directory the outputs are written to")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Search directories recursively")
+    parser.add_argument("--colors", type=int, default=20, choices=range(2, 31), metavar="2-30",
+                        help="Number of paint colors")
+    parser.add_argument("--quantizer", choices=QUANTIZERS, help="Color quantization engine")
+    parser.add_argument("--vector-format", choices=VECTOR_FORMATS, help="Write SVG or PDF templates instead of images")
+    parser.add_argument("--processes", type=int, default=config.WORKER_PROCESSES, help="Images converted at once")
+    parser.add_argument("--threads", type=int, help="Threads per process (default: an even share of the cores)")
+    parser.add_argument("--overwrite", action="store_true", help="Convert inputs whose outputs already exist")
+    args = parser.parse_args(argv)
+
+    processes = max(1, args.processes)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // processes)
+    output_root = Path(args.output)
+
+    # Name outputs after the input file (extension included, so photo.jpg and
+    # photo.png stay apart) and the color count; skip inputs that are already done
+    # Inputs that would still share outputs (same name from different arguments)
+    # are numbered in the order they were found, which reruns reproduce
+    tasks, skipped, taken = [], 0, set()
+    for input_path, subdirectory in find_inputs(args.inputs, args.recursive):
+        output_dir = output_root / subdirectory
+        name = f"{input_path.stem}_{input_path.suffix.lstrip('.').lower()}"
+        base_name, copy = f"{name}_{args.colors}", 1
+        while (output_dir, base_name) in taken:
+            copy += 1
+            base_name = f"{name}-{copy}_{args.colors}"
+        if copy > 1:
+            print(f"{input_path} shares its output name with another input, writing it as {base_name}",
+                  file=sys.stderr)
+        taken.add((output_dir, base_name))
+        done = all((output_dir / name).exists() for name in output_names(base_name, args.vector_format))
+        if done and not args.overwrite:
+            skipped += 1
+            continue
+        tasks.append((input_path, output_dir, base_name))
+    print(f"{len(tasks)} images to convert, {skipped} already done, "
+          f"{processes} processes x {threads} threads")
+
+    failed = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_process, initargs=(threads,)) as pool:
+        futures = {pool.submit(convert_file, input_path, output_dir, base_name, args.colors, args.quantizer,
+                               args.vector_format, threads): input_path
+                   for input_path, output_dir, base_name in tasks}
+        for done_count, future in enumerate(as_completed(futures), 1):
+            input_path = futures[future]
+            try:
+                seconds = future.result()
+                print(f"[{done_count}/{len(tasks)}] {input_path} ({seconds:.1f}s)")
+            except Exception as e:
+                failed += 1
+                print(f"[{done_count}/{len(tasks)}] {input_path} failed: {e}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    converted = len(tasks) - failed
+    rate = converted / elapsed if elapsed > 0 else 0.0
+    print(f"Converted {converted} images in {elapsed:.1f}s ({rate:.2f} images/sec), "
+          f"{skipped} skipped, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
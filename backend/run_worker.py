@@ -1,34 +1,85 @@
+import os
+import resource
+import signal
+import threading
 import time
 import logging
-from app.job_queue import JobQueue
-from app.worker import process_image
+import multiprocessing
+from app.core import config
+from app.job_queue import PREVIEW_JOB_PREFIX, JobQueue
+from app.worker import fail_upload, process_image, process_preview
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-def run_worker():
+def keep_leases(queue, upload_ids, stop):
+    """Renew the leases of the claimed jobs still in upload_ids until stop is set"""
+    interval = max(1, config.JOB_LEASE_SECONDS / 3)
+    while not stop.wait(interval):
+        for upload_id in list(upload_ids):
+            queue.heartbeat(upload_id)
+
+def peak_rss_exceeded():
+    """Whether this process's peak RSS has passed the configured worker ceiling"""
+    if config.WORKER_MAX_RSS_MB <= 0:
+        return False
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss > config.WORKER_MAX_RSS_MB * 1024
+
+def run_worker(shutdown=None):
+    """Process jobs until shutdown is set, claiming up to WORKER_BATCH_SIZE at a time"""
     queue = JobQueue()
-    logger.info("Worker started")
+    shutdown = shutdown or threading.Event()
+    logger.info(f"Worker {os.getpid()} started")
     
-    while True:
+    while not shutdown.is_set():
         try:
-            # Get next job
-            upload_id = queue.dequeue()
+            # Claim a batch of waiting jobs in one round trip, otherwise block until one arrives
+            upload_ids = queue.dequeue_many(config.WORKER_BATCH_SIZE) if config.WORKER_BATCH_SIZE > 1 else []
+            if not upload_ids:
+                upload_id = queue.dequeue(timeout=config.DEQUEUE_TIMEOUT)
+                if not upload_id:
+                    continue
+                upload_ids = [upload_id]
             
-            if upload_id:
-                logger.info(f"Processing upload {upload_id}")
-                try:
-                    success = process_image(upload_id)
+            stop_heartbeat = threading.Event()
+            heartbeat = threading.Thread(target=keep_leases, args=(queue, upload_ids, stop_heartbeat), daemon=True)
+            heartbeat.start()
+            try:
+                while upload_ids:
+                    upload_id = upload_ids[0]
+                    logger.info(f"Processing upload {upload_id}")
+                    error = "Processing failed"
+                    try:
+                        queue_wait, lane = queue.claim_info(upload_id)
+                        if upload_id.startswith(PREVIEW_JOB_PREFIX):
+                            success = process_preview(upload_id[len(PREVIEW_JOB_PREFIX):])
+                        else:
+                            success = process_image(upload_id, queue_wait=queue_wait, lane=lane)
+                    except Exception as e:
+                        logger.exception(f"Error processing {upload_id}")
+                        error = str(e)
+                        success = False
+                    
                     if success:
                         queue.complete_job(upload_id)
                     else:
-                        queue.fail_job(upload_id, "Processing failed")
-                except Exception as e:
-                    logger.exception(f"Error processing {upload_id}")
-                    queue.fail_job(upload_id, str(e))
-            else:
-                # No jobs available, wait a bit
-                time.sleep(1)
+                        queue.fail_job(upload_id, error)
+                    upload_ids.pop(0)
+                    
+                    # Exit after the job once over the memory ceiling; the supervisor starts a fresh process
+                    if peak_rss_exceeded():
+                        logger.warning(f"Worker {os.getpid()} passed {config.WORKER_MAX_RSS_MB} MB peak RSS, recycling")
+                        shutdown.set()
+                    
+                    # Hand the rest of the batch back when shutting down
+                    if shutdown.is_set():
+                        break
+            finally:
+                stop_heartbeat.set()
+                heartbeat.join()
+                for upload_id in upload_ids:
+                    queue.release(upload_id)
                 
         except KeyboardInterrupt:
             logger.info("Shutting down worker")
@@ -37,5 +88,54 @@ def run_worker():
             logger.exception("Unexpected error in worker loop")
             time.sleep(1)
 
+def worker_process():
+    """Entry point of a pooled worker process; finishes its current job on SIGTERM"""
+    shutdown = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: shutdown.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The supervisor handles Ctrl+C
+    run_worker(shutdown)
+
+def run_supervisor(processes=None):
+    """Run a pool of worker processes, restart any that die and requeue expired jobs"""
+    processes = processes or config.WORKER_PROCESSES
+    queue = JobQueue()
+    shutdown = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: shutdown.set())
+    logger.info(f"Supervisor starting {processes} worker processes")
+    
+    def start_worker():
+        process = multiprocessing.Process(target=worker_process, daemon=False)
+        process.start()
+        return process
+    
+    workers = [start_worker() for _ in range(processes)]
+    try:
+        while not shutdown.is_set():
+            # Reclaim jobs whose worker stopped sending heartbeats
+            requeued, failed = queue.requeue_expired()
+            for upload_id in requeued:
+                logger.warning(f"Requeued expired job {upload_id}")
+            # Jobs given up on would otherwise leave their upload processing forever;
+            # a lost preview leaves the upload to its full render
+            for upload_id, error in failed:
+                logger.error(f"Gave up on job {upload_id}: {error}")
+                if not upload_id.startswith(PREVIEW_JOB_PREFIX):
+                    fail_upload(upload_id, error)
+            
+            for i, process in enumerate(workers):
+                if not process.is_alive():
+                    logger.warning(f"Worker {process.pid} exited with code {process.exitcode}, restarting")
+                    workers[i] = start_worker()
+            
+            shutdown.wait(config.REAPER_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    
+    logger.info("Shutting down workers")
+    for process in workers:
+        process.terminate()  # SIGTERM: finish the current job, then exit
+    for process in workers:
+        process.join()
+
 if __name__ == "__main__":
-    run_worker() 
\ No newline at end of file
+    run_supervisor()
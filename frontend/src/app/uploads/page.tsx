@@ -17,6 +17,7 @@ interface Upload {
     status: string;
     processedFilename: string | null;
     filledFilename: string | null;
+    thumbnailFilename: string | null;
     errorMessage: string | null;
     createdAt: string;
     updatedAt: string;
@@ -24,20 +25,29 @@ interface Upload {
 
 export default function UploadsPage() {
     const [uploads, setUploads] = useState<Upload[]>([]);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
     const [loading, setLoading] = useState(true);
+    const [loadingMore, setLoadingMore] = useState(false);
     const [error, setError] = useState<string | null>(null);
     const router = useRouter();
 
+    // Fetch one page of uploads; the API pages with the nextCursor of the previous page
+    const fetchPage = async (cursor: string | null) => {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const response = await fetch(`${BACKEND_URL}/api/uploads${query}`);
+        const data = await response.json().catch(() => ({}));
+        if (!response.ok || data.error) {
+            throw new Error(data.error || `Server responded with status ${response.status}`);
+        }
+        return { uploads: (data.uploads || []) as Upload[], nextCursor: (data.nextCursor ?? null) as string | null };
+    };
+
     useEffect(() => {
         const fetchUploads = async () => {
             try {
-                const response = await fetch(`${BACKEND_URL}/api/uploads`);
-                if (!response.ok) {
-                    const errorData = await response.json().catch(() => ({}));
-                    throw new Error(errorData.error || `Server responded with status ${response.status}`);
-                }
-                const data = await response.json();
-                setUploads(data.uploads || []);
+                const page = await fetchPage(null);
+                setUploads(page.uploads);
+                setNextCursor(page.nextCursor);
                 setError(null);
             } catch (error) {
                 console.error('Error fetching uploads:', error);
@@ -52,6 +62,21 @@ export default function UploadsPage() {
         fetchUploads();
     }, []);
 
+    const loadMore = async () => {
+        if (!nextCursor) return;
+        setLoadingMore(true);
+        try {
+            const page = await fetchPage(nextCursor);
+            setUploads((current) => [...current, ...page.uploads]);
+            setNextCursor(page.nextCursor);
+        } catch (error) {
+            console.error('Error fetching more uploads:', error);
+            toast.error(error instanceof Error ? error.message : 'Failed to fetch more uploads');
+        } finally {
+            setLoadingMore(false);
+        }
+    };
+
     if (loading) {
         return (
             <div className="min-h-screen p-8 bg-gray-50 flex items-center justify-center">
@@ -97,11 +122,20 @@ export default function UploadsPage() {
                     <div className="space-y-6">
                         {uploads.map((upload) => (
                             <Card key={upload.id}>
-                                <CardHeader>
-                                    <CardTitle>{upload.originalName}</CardTitle>
-                                    <CardDescription>
-                                        Uploaded {new Date(upload.createdAt).toLocaleString()}
-                                    </CardDescription>
+                                <CardHeader className="flex flex-row items-center gap-4 space-y-0">
+                                    {upload.thumbnailFilename && (
+                                        <img
+                                            src={`${BACKEND_URL}/uploads/${upload.thumbnailFilename}`}
+                                            alt={upload.originalName}
+                                            className="h-16 w-16 rounded object-cover"
+                                        />
+                                    )}
+                                    <div className="space-y-1.5">
+                                        <CardTitle>{upload.originalName}</CardTitle>
+                                        <CardDescription>
+                                            Uploaded {new Date(upload.createdAt).toLocaleString()}
+                                        </CardDescription>
+                                    </div>
                                 </CardHeader>
                                 <CardContent>
                                     <UploadStatus
@@ -111,6 +145,14 @@ export default function UploadsPage() {
                                 </CardContent>
                             </Card>
                         ))}
+                        {nextCursor && (
+                            <div className="flex justify-center">
+                                <Button variant="outline" onClick={loadMore} disabled={loadingMore}>
+                                    {loadingMore && <Loader2 className="mr-2 h-4 w-4 animate-spin" />}
+                                    Load More
+                                </Button>
+                            </div>
+                        )}
                     </div>
                 )}
             </div>
@@ -6,6 +6,7 @@ import { cn } from '@/lib/utils';
 interface ImageCarouselProps {
     images: {
         url: string;
+        previewUrl?: string;  // Smaller copy shown inline; the full image opens in the modal
         label: string;
     }[];
     className?: string;
@@ -37,7 +38,7 @@ export function ImageCarousel({ images, className }: ImageCarouselProps) {
             <div className={cn("relative group", className)}>
                 <div className="relative aspect-square overflow-hidden rounded-lg">
                     <img
-                        src={images[currentIndex]?.url}
+                        src={images[currentIndex]?.previewUrl || images[currentIndex]?.url}
                         alt={images[currentIndex]?.label || 'Image'}
                         className="object-cover w-full h-full cursor-pointer transition-transform hover:scale-105"
                         onClick={() => setIsModalOpen(true)}
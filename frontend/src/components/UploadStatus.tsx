@@ -1,6 +1,8 @@
 import React, { useEffect, useState } from 'react';
 import { ImageCarousel } from './ImageCarousel';
 import { Loader2 } from 'lucide-react';
+import { Button } from '@/components/ui/button';
+import { subscribeToUpload, type ProgressEvent } from '@/lib/uploadEvents';
 
 interface UploadStatusProps {
     uploadId: string;
@@ -13,52 +15,56 @@ interface UploadDetails {
     filename: string;
     processedFilename?: string;
     filledFilename?: string;
+    previewFilename?: string;
+    filledPreviewFilename?: string;
+    fastPreviewFilename?: string;
     errorMessage?: string;
 }
 
 const BACKEND_URL = 'http://localhost:8000';
 
+type UploadState = UploadDetails['status'];
+
 export function UploadStatus({ uploadId, initialStatus = 'PENDING' }: UploadStatusProps) {
     const [uploadDetails, setUploadDetails] = useState<UploadDetails | null>(null);
-    const [isPolling, setIsPolling] = useState(true);
+    const [stage, setStage] = useState<string>(initialStatus.toLowerCase());
     const [error, setError] = useState<string | null>(null);
 
     useEffect(() => {
-        const checkStatus = async () => {
-            try {
-                const response = await fetch(`${BACKEND_URL}/api/uploads/${uploadId}`);
-                if (!response.ok) {
-                    const errorData = await response.json().catch(() => ({}));
-                    throw new Error(errorData.error || `Server responded with status ${response.status}`);
+        // The worker pushes stage events over the page's shared stream; no polling needed
+        return subscribeToUpload(
+            uploadId,
+            (event: ProgressEvent<UploadDetails & { status: string }>) => {
+                setStage(event.stage);
+                if (event.stage === 'missing') {
+                    setError('Upload not found');
+                    return;
                 }
-                const data = await response.json();
-                setUploadDetails(data);
-                setError(null);
-
-                // Stop polling if we reach a final state
-                if (data.status === 'COMPLETED' || data.status === 'FAILED') {
-                    setIsPolling(false);
+                if (event.upload) {
+                    setUploadDetails({
+                        ...event.upload,
+                        status: event.upload.status.toUpperCase() as UploadState,
+                    });
+                } else {
+                    setUploadDetails((current) => current && { ...current, status: 'PROCESSING' });
                 }
-            } catch (error) {
-                console.error('Error checking upload status:', error);
-                setError(error instanceof Error ? error.message : 'Failed to fetch upload status');
-                setIsPolling(false);
+                setError(null);
+            },
+            () => setError('Lost connection to the server'),
+        );
+    }, [uploadId]);
+
+    const cancel = async () => {
+        try {
+            const response = await fetch(`${BACKEND_URL}/api/uploads/${uploadId}/cancel`, { method: 'POST' });
+            const data = await response.json().catch(() => ({}));
+            if (!response.ok || data.error) {
+                throw new Error(data.detail || data.error || `Server responded with status ${response.status}`);
             }
-        };
-
-        // Initial check
-        checkStatus();
-
-        // Set up polling if not in a final state
-        let pollInterval: NodeJS.Timeout;
-        if (isPolling) {
-            pollInterval = setInterval(checkStatus, 2000); // Poll every 2 seconds
+        } catch (error) {
+            setError(error instanceof Error ? error.message : 'Failed to cancel');
         }
-
-        return () => {
-            if (pollInterval) clearInterval(pollInterval);
-        };
-    }, [uploadId, isPolling]);
+    };
 
     if (error) {
         return (
@@ -87,10 +93,22 @@ export function UploadStatus({ uploadId, initialStatus = 'PENDING' }: UploadStat
     if (uploadDetails.status === 'PENDING' || uploadDetails.status === 'PROCESSING') {
         return (
             <div className="flex flex-col items-center justify-center p-4 space-y-2">
+                {uploadDetails.fastPreviewFilename && (
+                    <img
+                        src={`${BACKEND_URL}/uploads/${uploadDetails.fastPreviewFilename}`}
+                        alt="Quick preview"
+                        className="max-w-xl w-full rounded"
+                    />
+                )}
                 <Loader2 className="h-6 w-6 animate-spin" />
                 <p className="text-sm text-gray-500">
-                    {uploadDetails.status === 'PENDING' ? 'Waiting to process...' : 'Processing your image...'}
+                    {uploadDetails.status === 'PENDING' ? 'Waiting to process...' : `Processing your image (${stage})...`}
                 </p>
+                {uploadDetails.status === 'PENDING' && (
+                    <Button variant="outline" size="sm" onClick={cancel}>
+                        Cancel
+                    </Button>
+                )}
             </div>
         );
     }
@@ -101,6 +119,7 @@ export function UploadStatus({ uploadId, initialStatus = 'PENDING' }: UploadStat
     if (uploadDetails.processedFilename) {
         images.push({
             url: `${BACKEND_URL}/uploads/${uploadDetails.processedFilename}`,
+            previewUrl: uploadDetails.previewFilename && `${BACKEND_URL}/uploads/${uploadDetails.previewFilename}`,
             label: 'Paint by Numbers Template'
         });
     }
@@ -108,6 +127,7 @@ export function UploadStatus({ uploadId, initialStatus = 'PENDING' }: UploadStat
     if (uploadDetails.filledFilename) {
         images.push({
             url: `${BACKEND_URL}/uploads/${uploadDetails.filledFilename}`,
+            previewUrl: uploadDetails.filledPreviewFilename && `${BACKEND_URL}/uploads/${uploadDetails.filledPreviewFilename}`,
             label: 'Color Reference'
         });
     }
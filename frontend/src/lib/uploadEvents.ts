@@ -0,0 +1,133 @@
+// Shared stage event streams for every upload on the page. Browsers allow
+// only a handful of connections per host, so instead of one EventSource per
+// upload card, all cards subscribe here and their uploads are followed over
+// one multiplexed stream (/api/uploads/events?ids=...) per MAX_STREAM_IDS uploads.
+
+const BACKEND_URL = 'http://localhost:8000';
+
+// Matches the backend's MAX_EVENT_STREAM_IDS
+const MAX_STREAM_IDS = 100;
+
+export const TERMINAL_STAGES = ['done', 'failed', 'missing'];
+
+const STAGES = ['pending', 'processing', 'preview', 'decoding', 'quantizing', 'rendering', 'encoding', ...TERMINAL_STAGES];
+
+export interface ProgressEvent<Upload = { status: string }> {
+    id: string;
+    stage: string;
+    upload?: Upload;
+    error?: string;
+}
+
+interface Subscriber {
+    onEvent: (event: ProgressEvent) => void;
+    onError: () => void;
+}
+
+interface Stream {
+    source: EventSource;
+    ids: Set<string>;
+}
+
+const subscribers = new Map<string, Set<Subscriber>>();
+// Latest event per subscribed upload, replayed to cards that subscribe later
+const lastEvents = new Map<string, ProgressEvent>();
+let streams: Stream[] = [];
+let scheduled = false;
+
+// Uploads that still need a stream: subscribed and not yet finished
+function wantedIds() {
+    return [...subscribers.keys()].filter((id) => !TERMINAL_STAGES.includes(lastEvents.get(id)?.stage ?? ''));
+}
+
+function openStream(ids: string[]): Stream {
+    const query = ids.map((id) => `ids=${encodeURIComponent(id)}`).join('&');
+    const source = new EventSource(`${BACKEND_URL}/api/uploads/events?${query}`);
+    const stream = { source, ids: new Set(ids) };
+
+    const handleEvent = (message: MessageEvent) => {
+        const event: ProgressEvent = JSON.parse(message.data);
+        if (subscribers.has(event.id)) {
+            lastEvents.set(event.id, event);
+        }
+        subscribers.get(event.id)?.forEach((subscriber) => subscriber.onEvent(event));
+        if (TERMINAL_STAGES.includes(event.stage)) {
+            scheduleSync();
+        }
+    };
+    STAGES.forEach((name) => source.addEventListener(name, handleEvent as EventListener));
+
+    source.onerror = () => {
+        // EventSource reconnects on its own; only report a closed stream
+        if (source.readyState === EventSource.CLOSED) {
+            stream.ids.forEach((id) => subscribers.get(id)?.forEach((subscriber) => subscriber.onError()));
+        }
+    };
+    return stream;
+}
+
+// Bring the open streams in line with the wanted uploads: close streams with
+// nothing left to follow, and reopen them all when an upload is not covered
+function syncStreams() {
+    scheduled = false;
+    const wanted = wantedIds();
+    const covered = new Set(streams.flatMap((stream) => [...stream.ids]));
+
+    if (wanted.every((id) => covered.has(id))) {
+        streams = streams.filter((stream) => {
+            const needed = wanted.some((id) => stream.ids.has(id));
+            if (!needed) {
+                stream.source.close();
+            }
+            return needed;
+        });
+        return;
+    }
+
+    streams.forEach((stream) => stream.source.close());
+    streams = [];
+    for (let start = 0; start < wanted.length; start += MAX_STREAM_IDS) {
+        streams.push(openStream(wanted.slice(start, start + MAX_STREAM_IDS)));
+    }
+}
+
+// Cards mount and unmount together; batch their changes into one resync
+function scheduleSync() {
+    if (!scheduled) {
+        scheduled = true;
+        setTimeout(syncStreams, 0);
+    }
+}
+
+/**
+ * Follow an upload's stage events. The latest known event is replayed right
+ * away; returns a function that stops following.
+ */
+export function subscribeToUpload<Upload extends { status: string }>(
+    id: string,
+    onEvent: (event: ProgressEvent<Upload>) => void,
+    onError: () => void,
+): () => void {
+    // Events carry the backend's upload record, which the caller knows the shape of
+    const subscriber = { onEvent: onEvent as Subscriber['onEvent'], onError };
+    if (!subscribers.has(id)) {
+        subscribers.set(id, new Set());
+    }
+    subscribers.get(id)!.add(subscriber);
+
+    const last = lastEvents.get(id);
+    if (last) {
+        subscriber.onEvent(last);
+    }
+    scheduleSync();
+
+    return () => {
+        const current = subscribers.get(id);
+        current?.delete(subscriber);
+        if (current && current.size === 0) {
+            subscribers.delete(id);
+            lastEvents.delete(id);
+        }
+        scheduleSync();
+    };
+}